@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from converter.synthetic import write_feature_set, write_cohort
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Relative slowdown (or memory growth) beyond which a stage is flagged as a regression
+DEFAULT_THRESHOLD = 0.2
+
+# Problem sizes; "small" is quick enough for a smoke run, "large" approaches production scale
+SIZES = {
+    "small": {"features": 2_000, "valueset_size": 20, "rows": 20_000, "columns": 40},
+    "medium": {"features": 20_000, "valueset_size": 50, "rows": 200_000, "columns": 100},
+    "large": {"features": 200_000, "valueset_size": 100, "rows": 2_000_000, "columns": 200},
+}
+
+
+def _peak_rss_bytes():
+    """
+    Peak resident set size of the current process, or None where it cannot be measured.
+    """
+    # On Linux, ru_maxrss survives exec and would report the parent's peak: read the high-water mark instead
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports kilobytes
+
+
+def _stage_transform_data(work_dir):
+    from converter.fhir2mip import read_from_json, transform_data
+    transform_data(read_from_json(os.path.join(work_dir, "fhir.json")), os.path.join(work_dir, "rejected.txt"))
+
+
+def _stage_stream_transform_data(work_dir):
+    from converter.fhir2mip import stream_transform_data
+    stream_transform_data(os.path.join(work_dir, "fhir.json"), os.path.join(work_dir, "rejected.txt"))
+
+
+def _stage_export_to_json(work_dir, compact=False):
+    from converter.fhir2mip import read_from_json, transform_data, export_to_json
+    transformed_data = transform_data(read_from_json(os.path.join(work_dir, "fhir.json")),
+                                      os.path.join(work_dir, "rejected.txt"))
+    start = time.perf_counter()
+    export_to_json(transformed_data, os.path.join(work_dir, "transformed.json"), compact)
+    return time.perf_counter() - start
+
+
+def _stage_export_to_json_compact(work_dir):
+    return _stage_export_to_json(work_dir, compact=True)
+
+
+def _stage_parquet_to_csv(work_dir):
+    from converter.parque2csv import parquet_to_csv
+    parquet_to_csv(os.path.join(work_dir, "cohort.parquet"), os.path.join(work_dir, "cohort.csv"), ["Patient", "*_stddev"])
+
+
+def _stage_parquet_to_mip(work_dir):
+    from converter.parque2csv import parquet_to_mip
+    parquet_to_mip(os.path.join(work_dir, "cohort.parquet"), os.path.join(work_dir, "cohort.csv"),
+                   os.path.join(work_dir, "rejected.txt"), ["Patient", "*_stddev"])
+
+
+# Stage name -> (function, unit of its throughput)
+STAGES = {
+    "transform_data": (_stage_transform_data, "features"),
+    "stream_transform_data": (_stage_stream_transform_data, "features"),
+    "export_to_json": (_stage_export_to_json, "features"),
+    "export_to_json_compact": (_stage_export_to_json_compact, "features"),
+    "parquet_to_csv": (_stage_parquet_to_csv, "rows"),
+    "parquet_to_mip": (_stage_parquet_to_mip, "rows"),
+}
+
+
+def _run_stage(name, work_dir):
+    """
+    Run one stage in the current (fresh) process and measure it. A stage may return its own
+    duration when it has to prepare its input first (e.g. the export stages).
+    """
+    function, _ = STAGES[name]
+    start = time.perf_counter()
+    measured = function(work_dir)
+    wall_time = measured if measured is not None else time.perf_counter() - start
+    return {"wall_time": wall_time, "peak_rss": _peak_rss_bytes()}
+
+
+def generate_inputs(work_dir, size):
+    """
+    Write the synthetic FHIR feature set and Parquet cohort of the given problem size.
+    """
+    params = SIZES[size]
+    write_feature_set(os.path.join(work_dir, "fhir.json"), num_features=params["features"],
+                      valueset_size=params["valueset_size"])
+    columns = params["columns"]
+    write_cohort(os.path.join(work_dir, "cohort.parquet"), num_rows=params["rows"], num_numeric=columns * 2 // 5,
+                 num_nominal=columns * 2 // 5, num_boolean=columns // 10, num_dropped=columns // 10)
+
+
+def run_benchmarks(size="small", stages=None, repeat=1):
+    """
+    Run each stage `repeat` times, every run in a fresh process so that peak RSS is per stage,
+    and keep the fastest run. Returns the results keyed by stage name.
+    """
+    params = SIZES[size]
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        generate_inputs(work_dir, size)
+        for name in stages or STAGES:
+            _, unit = STAGES[name]
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    runs.append(executor.submit(_run_stage, name, work_dir).result())
+            best = min(runs, key=lambda run: run["wall_time"])
+            items = params["features"] if unit == "features" else params["rows"]
+            results[name] = dict(best, throughput=items / best["wall_time"], unit=f"{unit}/s")
+            print(f"{name}: {best['wall_time']:.3f}s, {results[name]['throughput']:.0f} {unit}/s, "
+                  f"peak RSS {(best['peak_rss'] or 0) / 2 ** 20:.1f} MiB")
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Flag the stages whose wall time or peak RSS grew by more than `threshold` over the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        for metric in ("wall_time", "peak_rss"):
+            if result.get(metric) and base.get(metric) and result[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {base[metric]:.4g} -> {result[metric]:.4g} "
+                                   f"(+{result[metric] / base[metric] - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FHIR and Parquet conversion stages")
+    parser.add_argument("--size", choices=SIZES, default="small", help="Synthetic problem size")
+    parser.add_argument("--stage", action="append", choices=STAGES, help="Only run this stage (repeatable)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest is kept")
+    parser.add_argument("--save-baseline", help="Write the results to this baseline JSON file")
+    parser.add_argument("--baseline", help="Compare the results against this baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative growth of wall time or peak RSS reported as a regression")
+
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.size, args.stage, args.repeat)
+    report = {"size": args.size, "python": platform.python_version(), "machine": platform.machine(),
+              "results": results}
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("size") != args.size:
+            parser.error(f"The baseline was recorded with --size {baseline.get('size')}")
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
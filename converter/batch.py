@@ -0,0 +1,163 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from converter.compression import COMPRESSIONS, strip_compression_extension
+from converter.fhir2mip import transform_data, stream_transform_data, read_from_json, export_to_json
+
+DEFAULT_MANIFEST_NAME = "manifest.jsonl"
+
+
+def collect_input_files(inputs, recursive=False):
+    """
+    Expand input directories (their *.json files, also gzip or zstd compressed) and glob patterns
+    into a sorted list of unique files.
+    """
+    files = set()
+    for pattern in inputs:
+        patterns = [pattern]
+        if os.path.isdir(pattern):
+            directory = os.path.join(pattern, "**") if recursive else pattern
+            patterns = [os.path.join(directory, f"*.json{extension}") for extension in ("", *COMPRESSIONS)]
+        for glob_pattern in patterns:
+            files.update(path for path in glob.glob(glob_pattern, recursive=True) if os.path.isfile(path))
+    return sorted(files)
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of a file's content, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def output_paths(input_file, output_dir):
+    """
+    Output data model and rejected codes file of one input file.
+    """
+    stem = os.path.splitext(os.path.basename(strip_compression_extension(input_file)))[0]
+    return os.path.join(output_dir, f"{stem}.json"), os.path.join(output_dir, f"{stem}.rejected.txt")
+
+
+def convert_file(input_file, output_dir, stream=False, compact=False):
+    """
+    Convert one FHIR file and return its manifest record. Any failure is caught and recorded,
+    so that one bad file never stops the rest of the batch.
+    """
+    output_file, rejected_file = output_paths(input_file, output_dir)
+    record = {"input": input_file, "input_hash": None, "output": output_file, "rejected_file": rejected_file}
+    start = time.perf_counter()
+    try:
+        record["input_hash"] = file_hash(input_file)
+        if stream:
+            transformed_data = stream_transform_data(input_file, rejected_file)
+        else:
+            transformed_data = transform_data(read_from_json(input_file), rejected_file)
+        export_to_json(transformed_data, output_file, compact)
+        with open(rejected_file, 'r') as f:
+            record["rejected_count"] = sum(1 for _ in f)
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["duration"] = round(time.perf_counter() - start, 6)
+    return record
+
+
+def read_manifest(manifest_file):
+    """
+    Read the latest manifest record of every input file; a truncated last line (interrupted run) is ignored.
+    """
+    records = {}
+    if not os.path.exists(manifest_file):
+        return records
+    with open(manifest_file, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["input"]] = record
+    return records
+
+
+def is_done(record, input_file):
+    """
+    Whether a previous run already converted this exact input content successfully.
+    """
+    return (record is not None and record.get("status") == "ok" and os.path.exists(record["output"])
+            and record["input_hash"] == file_hash(input_file))
+
+
+def convert_batch(inputs, output_dir, manifest_file=None, workers=None, recursive=False, stream=False,
+                  compact=False, resume=True):
+    """
+    Convert every file matched by `inputs` (directories or glob patterns) in a process pool.
+    Each finished file is appended to a JSON Lines manifest (input hash, output path, rejected count,
+    duration, status), so an interrupted batch resumes by skipping the files already converted.
+    Returns the records of the files processed in this run.
+    """
+    input_files = collect_input_files(inputs, recursive)
+    stems = Counter(output_paths(input_file, output_dir)[0] for input_file in input_files)
+    duplicates = sorted(stem for stem, count in stems.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Several input files would be written to the same outputs: {duplicates}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = manifest_file or os.path.join(output_dir, DEFAULT_MANIFEST_NAME)
+    previous_records = read_manifest(manifest_file) if resume else {}
+    pending = [input_file for input_file in input_files if not is_done(previous_records.get(input_file), input_file)]
+    print(f"{len(pending)} file(s) to convert, {len(input_files) - len(pending)} already done")
+
+    records = []
+    with open(manifest_file, 'a' if resume else 'w') as manifest, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_file, input_file, output_dir, stream, compact): input_file
+                   for input_file in pending}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                record = {"input": futures[future], "status": "error", "error": f"{type(e).__name__}: {e}"}
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            records.append(record)
+
+    failed = [record for record in records if record["status"] != "ok"]
+    print(f"Converted {len(records) - len(failed)} file(s), {len(failed)} failed. Manifest: {manifest_file}")
+    return records
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Convert many FHIR JSON files to MIP data models in parallel")
+    parser.add_argument("inputs", nargs="+", help="Input directories or glob patterns")
+    parser.add_argument("output_dir", help="Directory receiving the data models and rejected codes files")
+    parser.add_argument("--manifest", help=f"Manifest file (defaults to <output_dir>/{DEFAULT_MANIFEST_NAME})")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--recursive", action="store_true", help="Search input directories recursively")
+    parser.add_argument("--stream", action="store_true", help="Parse every input incrementally")
+    parser.add_argument("--compact", action="store_true", help="Write the output JSON without indentation")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Convert every file again and start a new manifest")
+
+    args = parser.parse_args(argv)
+
+    records = convert_batch(args.inputs, args.output_dir, args.manifest, args.workers, args.recursive,
+                            args.stream, args.compact, resume=not args.no_resume)
+    if any(record["status"] != "ok" for record in records):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import sys
+import argparse
+import importlib
+
+# Subcommand -> (entry point, summary). Entry points are only imported once their subcommand is chosen,
+# so schema conversions never pay for importing pyarrow/pandas and start in tens of milliseconds.
+COMMANDS = {
+    "schema": ("converter.fhir2mip:main", "Convert a FHIR feature set into a MIP data model"),
+    "batch": ("converter.batch:main", "Convert many FHIR feature sets in parallel"),
+    "merge": ("converter.merge:main", "Merge the data models of many sites into a federated one"),
+    "data": ("converter.parque2csv:main", "Convert a Parquet file to MIP-ready CSV/Parquet/Arrow data"),
+    "profile": ("converter.parque2csv:profile_main", "Profile the columns of a Parquet file"),
+    "validate": ("converter.validate:main", "Check that exported data conforms to a data model"),
+    "serve": ("converter.server:main", "Serve conversions over local HTTP with warm caches"),
+}
+
+
+def load_command(command):
+    """
+    Import the entry point of a subcommand.
+    """
+    module_name, function_name = COMMANDS[command][0].split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="fhir2mip",
+        description="FHIR to MIP schema and data conversion",
+        epilog="commands:\n" + "\n".join(f"  {command:<10}{summary}" for command, (_, summary) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command",
+                        help="One of the subcommands below; run '<command> --help' for its options")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    load_command(args.command)(args.arguments, prog=f"{parser.prog} {args.command}")
+
+
+if __name__ == "__main__":
+    main()
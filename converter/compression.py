@@ -0,0 +1,184 @@
+import io
+import os
+import gzip
+from collections import deque
+from functools import partial
+
+# Extension -> compression of the output files, and the magic bytes identifying compressed inputs
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+EXTENSIONS = {compression: extension for extension, compression in COMPRESSIONS.items()}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Uncompressed bytes per independently compressed block
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def compression_of(path):
+    """
+    Compression implied by the extension of an output file ('.gz' or '.zst'), or None.
+    """
+    return COMPRESSIONS.get(os.path.splitext(str(path))[1].lower())
+
+
+def strip_compression_extension(path):
+    """
+    Path without its compression extension ('cohort.csv.gz' -> 'cohort.csv').
+    """
+    root, extension = os.path.splitext(str(path))
+    return root if extension.lower() in COMPRESSIONS else str(path)
+
+
+def detect_compression(path):
+    """
+    Compression of an existing file, recognised from its first bytes whatever its name.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def _check_compression(compression):
+    if compression not in DEFAULT_LEVELS:
+        raise ValueError(f"Invalid compression: {compression}. Expected one of {sorted(DEFAULT_LEVELS)}.")
+
+
+def _compressor(compression, level=None):
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == "gzip":
+        # A fixed mtime keeps the output reproducible; zlib releases the GIL while compressing
+        return partial(gzip.compress, compresslevel=level, mtime=0)
+    # pyarrow is only needed (and imported) for zstd
+    import pyarrow as pa
+
+    codec = pa.Codec("zstd", compression_level=level)
+    return partial(codec.compress, asbytes=True)
+
+
+class ParallelCompressedWriter(io.BufferedIOBase):
+    """
+    Binary file compressing what is written to it in independent blocks of `block_size` bytes,
+    in a pool of `workers` threads, like pigz. Each block becomes its own gzip member or zstd frame;
+    their concatenation is a valid .gz/.zst file that any decompressor reads as a single stream.
+    Blocks are written out in order, with at most two blocks per worker in flight.
+    """
+
+    def __init__(self, fileobj, compression, level=None, workers=None, block_size=DEFAULT_BLOCK_SIZE):
+        # Imported here so that uncompressed runs do not pay for concurrent.futures at startup
+        from concurrent.futures import ThreadPoolExecutor
+
+        _check_compression(compression)
+        self._file = fileobj
+        self._compress = _compressor(compression, level)
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._blocks = 0
+        workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compress")
+        self._pending = deque()
+        self._max_pending = 2 * workers
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block):
+        self._blocks += 1
+        self._pending.append(self._executor.submit(self._compress, block))
+        while len(self._pending) > self._max_pending:
+            self._file.write(self._pending.popleft().result())
+
+    def flush(self):
+        """
+        Write out the blocks compressed so far; an incomplete block stays buffered until close.
+        """
+        if self.closed or self._file.closed:
+            return
+        while self._pending:
+            self._file.write(self._pending.popleft().result())
+        self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._blocks:
+                # Always at least one block, so that even an empty output is a valid compressed file
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            self.flush()
+        finally:
+            self._executor.shutdown()
+            self._file.close()
+            super().close()
+
+
+def open_output(path, mode='w', compression=None, level=None, workers=None, encoding=None, newline=None):
+    """
+    Open an output file for writing, compressed in parallel blocks (see ParallelCompressedWriter)
+    with `compression`, or by default after its extension ('.gz' for gzip, '.zst' for zstd).
+    Text mode unless `mode` contains 'b'.
+    """
+    compression = compression or compression_of(path)
+    if compression is None:
+        return open(path, mode, encoding=None if 'b' in mode else encoding, newline=newline)
+    _check_compression(compression)
+    writer = ParallelCompressedWriter(open(path, 'wb'), compression, level, workers)
+    if 'b' in mode:
+        return writer
+    return io.TextIOWrapper(writer, encoding=encoding, newline=newline)
+
+
+def open_input(path, mode='r', encoding=None, newline=None):
+    """
+    Open an input file for reading, decompressing gzip or zstd content on the fly whatever its name.
+    Text mode unless `mode` contains 'b'.
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, mode, encoding=None if 'b' in mode else encoding, newline=newline)
+    if compression == "gzip":
+        raw = gzip.open(path, 'rb')
+    else:
+        import pyarrow as pa
+
+        raw = io.BufferedReader(_NativeReader(pa.input_stream(path, compression="zstd")))
+    if 'b' in mode:
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding, newline=newline)
+
+
+class _NativeReader(io.RawIOBase):
+    """
+    Raw file over a pyarrow input stream, so that it can be buffered and decoded like any file.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+        super().close()
@@ -0,0 +1,21 @@
+def _variables_by_code(data_model):
+    variables = {variable["code"]: variable for variable in data_model.get("variables", [])}
+    for group in data_model.get("groups", []):
+        for variable in group["variables"]:
+            variables[variable["code"]] = variable
+    return variables
+
+
+def diff_data_models(old_data_model, new_data_model):
+    """
+    Compare two data models variable by variable (by code, across all groups).
+    Returns the sorted codes of the added, removed and changed variables.
+    """
+    old_variables = _variables_by_code(old_data_model or {})
+    new_variables = _variables_by_code(new_data_model)
+    return {
+        "added": sorted(new_variables.keys() - old_variables.keys()),
+        "removed": sorted(old_variables.keys() - new_variables.keys()),
+        "changed": sorted(code for code in new_variables.keys() & old_variables.keys()
+                          if new_variables[code] != old_variables[code]),
+    }
@@ -1,5 +1,22 @@
+import os
+import re
 import json
 import argparse
+from collections import Counter
+from functools import partial
+
+from converter.compression import open_input, open_output, EXTENSIONS
+from converter.feature_cache import diff_data_models
+from converter.instrumentation import stage, profiling
+from converter.model import Variable, Enumerations, BOOLEAN_ENUMERATIONS, to_serialisable
+
+try:
+    import orjson  # Optional, much faster serialisation backend
+except ImportError:
+    orjson = None
+
+# Characters read from the input file at a time when parsing in streaming mode
+DEFAULT_CHUNK_SIZE = 64 * 1024
 
 
 def validate_data_type(data_type):
@@ -13,13 +30,29 @@ def validate_data_type(data_type):
     return data_type
 
 
+def normalise_code(name):
+    """
+    Derive a variable code from a feature or column name: spaces and dashes become underscores, lowercase.
+    Both the schema and the exported data columns go through this function, so that they always agree.
+    """
+    return name.replace(" ", "_").replace("-", "_").lower()
+
+
+def sql_type_of(data_type):
+    """
+    MIP sql_type of a validated dataType: numbers are stored as 'real', booleans and nominal values as 'text'.
+    """
+    return "real" if data_type == "NUMERIC" else "text"
+
+
 def transform_feature(feature, rejected_codes):
     """
     Transform a single feature or outcome into the expected format.
     Adjust the name, check for 'min' and 'max' equality, and ensure boolean fields are handled as nominal with True/False enumerations.
+    The result is a compact Variable, which reads like the variable dict and becomes one when exported.
     """
     # Modify the name to replace spaces with underscores and make it lowercase
-    code_name = feature["name"].replace(" ", "_").replace("-", "_").lower()  # Ensure lowercase
+    code_name = normalise_code(feature["name"])
 
     # Check if 'numOfNotNull' exists and is 0
     if "statistics" in feature and feature["statistics"].get("numOfNotNull") == 0:
@@ -34,54 +67,40 @@ def transform_feature(feature, rejected_codes):
         print(f"Validation error for {code_name}: {e}")
         return None  # Skip feature with invalid dataType
 
+    methodology = ", ".join(feature.get("generatedDescription", []))
+
     # Adjust for boolean fields, ensuring they are treated as nominal
     if feature["dataType"] == "BOOLEAN":
-        new_item = {
-            "code": code_name,
-            "label": feature["description"],
-            "description": feature["description"],
-            "sql_type": "text",
-            "isCategorical": True,
-            "type": "nominal",
-            "methodology": ", ".join(feature.get("generatedDescription", [])),
-            "units": "",
-            "enumerations": [
-                { "code": "True", "label": "True" },
-                { "code": "False", "label": "False" }
-            ]
-        }
-    else:
-        # Standard handling for non-boolean fields
-        new_item = {
-            "code": code_name,
-            "label": feature["description"],
-            "description": feature["description"],
-            "sql_type": "text" if feature["dataType"] == "NOMINAL" else "real" if feature["dataType"] == "NUMERIC" else "text",
-            "isCategorical": feature["dataType"] == "NOMINAL",
-            "type": "nominal" if feature["dataType"] == "NOMINAL" else "real" if feature["dataType"] == "NUMERIC" else "nominal",
-            "methodology": ", ".join(feature.get("generatedDescription", [])),
-            "units": ""  # Empty as no units are provided in the original data
-        }
-
-        # Handle enumerations for categorical data
-        if feature["dataType"] == "NOMINAL" and "valueset" in feature["statistics"]:
-            enumerations = [{"code": value, "label": value} for value in feature["statistics"]["valueset"]]
-            new_item["enumerations"] = enumerations
-        else:
-            new_item["enumerations"] = []
-
-        # Handle numeric variables' min/max values and remove them if they are equal
-        if feature["dataType"] == "NUMERIC" and "statistics" in feature:
-            stats = feature["statistics"]
-            if "min" in stats and "max" in stats and stats["min"] != stats["max"]:
-                new_item["minValue"] = stats.get("min")
-                new_item["maxValue"] = stats.get("max")
-            elif "min" in stats and "max" in stats and stats["min"] == stats["max"]:
-                # If min and max are equal, remove both
-                pass
+        return Variable(code_name, feature["description"], feature["description"], "text", True, "nominal",
+                        methodology, "", BOOLEAN_ENUMERATIONS)
+
+    # Standard handling for non-boolean fields
+    new_item = Variable(
+        code_name,
+        feature["description"],
+        feature["description"],
+        sql_type_of(feature["dataType"]),
+        feature["dataType"] == "NOMINAL",
+        "nominal" if feature["dataType"] == "NOMINAL" else "real" if feature["dataType"] == "NUMERIC" else "nominal",
+        methodology,
+        ""  # Empty as no units are provided in the original data
+    )
+
+    # Handle enumerations for categorical data
+    if feature["dataType"] == "NOMINAL" and "valueset" in feature["statistics"]:
+        new_item.enumerations = Enumerations(feature["statistics"]["valueset"])
+
+    # Handle numeric variables' min/max values and remove them if they are equal
+    if feature["dataType"] == "NUMERIC" and "statistics" in feature:
+        stats = feature["statistics"]
+        if "min" in stats and "max" in stats and stats["min"] != stats["max"]:
+            new_item.has_range = True
+            new_item.min_value = stats.get("min")
+            new_item.max_value = stats.get("max")
 
     return new_item
 
+
 def create_dataset_variable(dataset_name):
     """
     Create the 'dataset' variable as an enumeration based on the dataset name.
@@ -103,18 +122,11 @@ def create_dataset_variable(dataset_name):
         "units": ""
     }
 
-def transform_data(original_data, rejected_file_path):
+def build_data_model(dataset, feature_variables, outcome_variables):
     """
-    Transform the entire dataset from the original format to the expected format,
-    separating features and outcomes into different groups, and adding the 'dataset' variable.
-    Rejected feature codes with 'numOfNotNull' == 0 are logged to a file.
+    Assemble the MIP data model of one dataset entry from its already transformed
+    feature and outcome variables, adding the 'dataset' variable.
     """
-    # Check if the original data contains entries
-    if not original_data["entries"]:
-        raise ValueError("No entries found in the original data.")
-
-    dataset = original_data["entries"][0]
-
     # Initialize transformed data structure
     transformed_data = {
         "code": dataset["name"],
@@ -128,77 +140,509 @@ def transform_data(original_data, rejected_file_path):
     # Create the 'dataset' variable based on the dataset name and add it to variables
     dataset_variable = create_dataset_variable(dataset["name"])
 
-    # Track rejected feature codes
-    rejected_codes = []
-
-    # Transform features into a group
+    # Features and outcomes go into separate groups, without the rejected (None) variables
     feature_group = {
         "code": "features",
         "label": "Features",
-        "variables": [transform_feature(feature, rejected_codes) for feature in dataset["featureSet"]["features"]]
+        "variables": [var for var in feature_variables if var]
     }
-
-    # Remove None values (rejected features)
-    feature_group["variables"] = [var for var in feature_group["variables"] if var]
-
-    # Transform outcomes into a separate group if it exists
     outcome_group = {
         "code": "outcomes",
         "label": "Outcomes",
-        "variables": [transform_feature(outcome, rejected_codes) for outcome in
-                      dataset["featureSet"].get("outcomes", [])]
+        "variables": [var for var in outcome_variables if var]
     }
 
-    # Remove None values (rejected outcomes)
-    outcome_group["variables"] = [var for var in outcome_group["variables"] if var]
-
     # Add the 'dataset' variable and both feature and outcome groups
     transformed_data["variables"] = [dataset_variable]  # Always include the dataset variable first
     transformed_data["groups"] = [feature_group, outcome_group]
 
-    # Write rejected codes to the text file
-    with open(rejected_file_path, 'w') as rejected_file:
+    return transformed_data
+
+
+def write_rejected_codes(rejected_codes, rejected_file_path):
+    """
+    Write rejected feature codes to a text file, one per line.
+    """
+    with stage("write_rejected"), open(rejected_file_path, 'w') as rejected_file:
         for code in rejected_codes:
             rejected_file.write(f"{code}\n")
 
+
+def transform_data(original_data, rejected_file_path):
+    """
+    Transform the entire dataset from the original format to the expected format,
+    separating features and outcomes into different groups, and adding the 'dataset' variable.
+    Rejected feature codes with 'numOfNotNull' == 0 are logged to a file.
+    """
+    # Check if the original data contains entries
+    if not original_data["entries"]:
+        raise ValueError("No entries found in the original data.")
+
+    transformed_data, rejected_codes = transform_entry(original_data["entries"][0])
+
+    # Write rejected codes to the text file
+    write_rejected_codes(rejected_codes, rejected_file_path)
+
     return transformed_data
 
 
+def transform_entry(dataset):
+    """
+    Transform a single dataset entry of the bundle into its own MIP data model.
+    Returns the data model together with the codes rejected while transforming it.
+    """
+    # Track rejected feature codes
+    rejected_codes = []
+
+    with stage("transform_features"):
+        feature_variables = [transform_feature(feature, rejected_codes) for feature in dataset["featureSet"]["features"]]
+    with stage("transform_outcomes"):
+        outcome_variables = [transform_feature(outcome, rejected_codes) for outcome in
+                             dataset["featureSet"].get("outcomes", [])]
+
+    return build_data_model(dataset, feature_variables, outcome_variables), rejected_codes
+
+
+def transform_all_entries(original_data, rejected_file_path, workers=None):
+    """
+    Transform every dataset entry of the bundle into its own MIP data model.
+    Entries are spread across a pool of `workers` processes (the CPU count by default, 1 runs
+    in-process). The rejected codes of all entries are logged to a single file, in entry order.
+    """
+    entries = original_data["entries"]
+    if not entries:
+        raise ValueError("No entries found in the original data.")
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(entries) == 1:
+        results = [transform_entry(dataset) for dataset in entries]
+    else:
+        # Hand out a few chunks per worker so that pickling overhead stays low on many small entries
+        chunksize = max(1, len(entries) // (workers * 4))
+        # Only needed here; importing multiprocessing up front would slow down every schema conversion
+        from concurrent.futures import ProcessPoolExecutor
+
+        with stage("transform_entries"), ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(transform_entry, entries, chunksize=chunksize))
+
+    rejected_codes = [code for _, entry_rejected in results for code in entry_rejected]
+    write_rejected_codes(rejected_codes, rejected_file_path)
+
+    return [data_model for data_model, _ in results]
+
+
+class _JSONStream:
+    """
+    Minimal incremental reader over a JSON text file.
+    Only the containers we walk through are tokenised by hand; every value we actually
+    need is decoded with json.JSONDecoder.raw_decode, so the buffer never holds much
+    more than the value currently being decoded.
+    """
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, fp, chunk_size):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size):
+        """
+        Append up to `size` more characters to the buffer, dropping the consumed prefix.
+        Returns False once the file is exhausted.
+        """
+        chunk = self._fp.read(size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """
+        Return the next non-whitespace character without consuming it, or "" at the end of the file.
+        """
+        while True:
+            self._pos = self._WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill(self._chunk_size):
+                return ""
+
+    def expect(self, char):
+        """
+        Consume `char`, which must be the next non-whitespace character.
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed JSON: expected '{char}' but found '{found or 'end of file'}'.")
+        self._pos += 1
+
+    def value(self):
+        """
+        Decode and consume the next complete JSON value.
+        """
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # The value is cut by the end of the buffer: read more (doubling to stay linear) and retry
+                if self._eof or not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number ending exactly at the buffer boundary may continue in the next chunk, and one cut
+            # right before its fraction or exponent ('1.' or '1.5e') is decoded as the shorter '1' or '1.5'
+            if (end == len(self._buffer) or self._is_cut_number(value, end)) and not self._eof and self._fill(size):
+                continue
+            self._pos = end
+            return value
+
+    def _is_cut_number(self, value, end):
+        return (isinstance(value, (int, float)) and not isinstance(value, bool)
+                and self._buffer[end] in ".eE")
+
+    def iter_array(self):
+        """
+        Walk an array, yielding once per element with the stream positioned on it.
+        The caller must consume each element before advancing.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            if self._at_close("]"):
+                return
+
+    def iter_object(self):
+        """
+        Walk an object, yielding each key with the stream positioned on its value.
+        The caller must consume each value before advancing.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"Malformed JSON: expected an object key but found {key!r}.")
+            self.expect(":")
+            yield key
+            if self._at_close("}"):
+                return
+
+    def _at_close(self, closing):
+        """
+        Consume either the container's closing character (returning True) or the separating comma.
+        """
+        if self.peek() == closing:
+            self._pos += 1
+            return True
+        self.expect(",")
+        return False
+
+
+def iter_feature_stream(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Incrementally walk entries[*].featureSet.features[*] / outcomes[*] of a FHIR JSON file.
+    Yields (entry_index, group, feature) tuples as each raw feature is decoded, with group
+    being "features" or "outcomes". Once an entry is closed, (entry_index, "entry", fields)
+    is yielded, where fields holds every key of the entry except 'featureSet'.
+    Peak memory is bounded by the largest single feature, not by the size of the file.
+    gzip or zstd compressed files are decompressed on the fly.
+    """
+    with open_input(filename) as json_file:
+        stream = _JSONStream(json_file, chunk_size)
+        for key in stream.iter_object():
+            if key != "entries":
+                stream.value()
+                continue
+            for index, _ in enumerate(stream.iter_array()):
+                fields = {}
+                for entry_key in stream.iter_object():
+                    if entry_key != "featureSet":
+                        fields[entry_key] = stream.value()
+                        continue
+                    for group in stream.iter_object():
+                        if group not in ("features", "outcomes"):
+                            stream.value()
+                            continue
+                        for _ in stream.iter_array():
+                            yield index, group, stream.value()
+                yield index, "entry", fields
+
+
+def stream_transform_data(filename, rejected_file_path, chunk_size=DEFAULT_CHUNK_SIZE, all_entries=False):
+    """
+    Streaming counterpart of transform_data that reads the FHIR JSON file incrementally.
+    Each feature/outcome is handed to transform_feature as soon as it is parsed, so the raw
+    feature set never has to be held in memory. Like transform_data, only the first entry is
+    converted unless `all_entries` is set, in which case the list of all data models is returned.
+    """
+    variables = {"features": [], "outcomes": []}
+    rejected_codes = []
+    data_models = []
+
+    events = iter_feature_stream(filename, chunk_size)
+    while True:
+        with stage("read"):
+            event = next(events, None)
+        if event is None:
+            break
+        index, group, payload = event
+        if group == "entry":
+            data_models.append(build_data_model(payload, variables["features"], variables["outcomes"]))
+            if not all_entries:
+                break  # Only the first entry is converted; closing the generator closes the file
+            variables = {"features": [], "outcomes": []}
+            continue
+        with stage(f"transform_{group}"):
+            variables[group].append(transform_feature(payload, rejected_codes))
+
+    if not data_models:
+        raise ValueError("No entries found in the original data.")
+
+    write_rejected_codes(rejected_codes, rejected_file_path)
+    return data_models if all_entries else data_models[0]
+
+
 def read_from_json(filename):
     """
-    Read data from a JSON file.
+    Read data from a JSON file, possibly gzip or zstd compressed.
     """
-    with open(filename, 'r') as json_file:
+    with open_input(filename) as json_file:
         data = json.load(json_file)
     return data
 
 
-def export_to_json(transformed_data, filename="transformed_data.json"):
+def _double_indentation(text):
+    """
+    Turn the two-space indentation of orjson into json.dump's four spaces with one str.replace per nesting level:
+    once the first k levels are doubled, the lines of level k + 1 and deeper start with 4 * k + 2 spaces or more,
+    and the shallower ones with fewer.
+    """
+    level = 1
+    while True:
+        prefix = "\n" + " " * (4 * level - 2)
+        if prefix not in text:
+            return text
+        text = text.replace(prefix, prefix + "  ")
+        level += 1
+
+
+class DataModelWriter:
+    """
+    Serialise data models to a text file piece by piece. Groups are walked one at a time and
+    their variables encoded one by one, so 'groups' and 'variables' may be any iterables
+    (e.g. generators producing variables on the fly) and the full document is never built as
+    one string. Indented output is laid out like json.dump(..., indent=4); compact output
+    has no whitespace. orjson is used as encoding backend when it is installed: the JSON values are
+    the same, but non-ASCII characters are then written as UTF-8 instead of '\\uXXXX' escapes and
+    some floats are spelled differently (1e16 instead of 1e+16).
+    """
+
+    _INDENT = "    "
+
+    def __init__(self, fp, compact=False, fast=orjson is not None):
+        self._fp = fp
+        self._compact = compact
+        if fast and orjson is None:
+            raise ValueError("The fast JSON backend requires orjson to be installed.")
+        if fast and compact:
+            self._encode = lambda value: orjson.dumps(value, default=to_serialisable).decode("utf-8")
+        elif fast:
+            # orjson only indents by two spaces: double every indentation to match indent=4
+            self._encode = lambda value: _double_indentation(
+                orjson.dumps(value, default=to_serialisable, option=orjson.OPT_INDENT_2).decode("utf-8"))
+        elif compact:
+            self._encode = partial(json.dumps, separators=(",", ":"), default=to_serialisable)
+        else:
+            self._encode = partial(json.dumps, indent=4, default=to_serialisable)
+        self._key_separator = ":" if compact else ": "
+
+    def write(self, value):
+        """
+        Write a data model, or a list of data models, to the file.
+        """
+        if isinstance(value, dict):
+            self._write_object(value, 0)
+        elif isinstance(value, (list, tuple)):
+            self._write_array(value, 0, self._write_object)
+        else:
+            self._write_encoded(value, 0)
+
+    def _newline(self, level):
+        return "" if self._compact else "\n" + self._INDENT * level
+
+    def _write_encoded(self, value, level):
+        text = self._encode(value)
+        if not self._compact and level:
+            # JSON strings never contain raw newlines, so every newline starts an indented line
+            text = text.replace("\n", self._newline(level))
+        self._fp.write(text)
+
+    def _write_object(self, obj, level):
+        if not isinstance(obj, dict) or not obj:
+            self._write_encoded(obj, level)
+            return
+        self._fp.write("{")
+        for index, (key, value) in enumerate(obj.items()):
+            self._fp.write(("," if index else "") + self._newline(level + 1) + self._encode(key) + self._key_separator)
+            if key == "groups":
+                self._write_array(value, level + 1, self._write_object)
+            elif key == "variables":
+                self._write_array(value, level + 1, self._write_encoded)
+            else:
+                self._write_encoded(value, level + 1)
+        self._fp.write(self._newline(level) + "}")
+
+    def _write_array(self, items, level, write_item):
+        self._fp.write("[")
+        empty = True
+        for item in items:
+            self._fp.write(("" if empty else ",") + self._newline(level + 1))
+            write_item(item, level + 1)
+            empty = False
+        self._fp.write("]" if empty else self._newline(level) + "]")
+
+
+def export_to_json(transformed_data, filename="transformed_data.json", compact=False, compression=None):
     """
-    Export transformed data to a JSON file.
+    Export transformed data to a JSON file, streamed through DataModelWriter.
+    With `compact`, no indentation or whitespace is written. The file is compressed with
+    `compression` ("gzip" or "zstd"), by default after its '.gz'/'.zst' extension (see open_output).
     """
-    with open(filename, 'w') as json_file:
-        json.dump(transformed_data, json_file, indent=4)
+    with stage("export"), open_output(filename, compression=compression, encoding="utf-8") as json_file:
+        DataModelWriter(json_file, compact).write(transformed_data)
     print(f"Data has been exported to {filename}")
 
 
-def main():
-    parser = argparse.ArgumentParser()
+def is_safe_file_name(name):
+    """
+    Whether `name` can be used as a file name inside a directory: not empty, no path separator, not '.' or '..'.
+    """
+    separators = {os.sep, os.altsep} - {None}
+    return bool(name) and name not in (".", "..") and not any(separator in name for separator in separators)
+
+
+def export_data_models(data_models, output_path, split=False, compact=False, compression=None):
+    """
+    Export several data models, either combined as a JSON list into `output_path`
+    or, with `split`, one '<dataset code>.json' file per data model inside the `output_path` directory
+    ('<dataset code>.json.gz' or '.json.zst' with `compression`).
+    """
+    if not split:
+        export_to_json(data_models, output_path, compact, compression)
+        return
+
+    codes = Counter(data_model["code"] for data_model in data_models)
+    duplicates = sorted(code for code, count in codes.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate dataset codes cannot be split into separate files: {duplicates}")
+    # The codes come straight from the input bundle, so they must not escape the output directory
+    unsafe = sorted(code for code in codes if not is_safe_file_name(code))
+    if unsafe:
+        raise ValueError(f"Dataset codes cannot be used as file names: {unsafe}")
+
+    os.makedirs(output_path, exist_ok=True)
+    for data_model in data_models:
+        file_name = f"{data_model['code']}.json{EXTENSIONS.get(compression, '')}"
+        export_to_json(data_model, os.path.join(output_path, file_name), compact, compression)
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog)
     parser.add_argument("input_file", help="The input JSON file to transform")
     parser.add_argument("output_file", help="The output JSON file to save the transformed data")
     parser.add_argument("rejected_file", help="The file to save rejected feature codes")
+    parser.add_argument("--stream", action="store_true",
+                        help="Parse the input incrementally, one feature at a time, to keep memory bounded")
+    parser.add_argument("--all-entries", action="store_true",
+                        help="Convert every entry of the bundle into its own data model instead of only the first")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes used with --all-entries (defaults to the CPU count)")
+    parser.add_argument("--split", action="store_true",
+                        help="With --all-entries, treat output_file as a directory and write one file per dataset")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Compare with the existing output_file and only rewrite it when a variable changed")
+    parser.add_argument("--diff", help="Write the added/removed/changed variables to this JSON file (implies --incremental)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Write the output JSON without indentation")
+    parser.add_argument("--compress", choices=sorted(EXTENSIONS),
+                        help="Compress the output JSON in parallel blocks (implied by a '.gz'/'.zst' output file name)")
+    parser.add_argument("--profile", metavar="REPORT_FILE",
+                        help="Write the time and memory spent in each stage to this JSON report")
+
+    args = parser.parse_args(argv)
+    args.incremental = args.incremental or args.diff is not None
+    if args.incremental and args.all_entries:
+        parser.error("--incremental cannot be combined with --all-entries")
+
+    with profiling(args.profile):
+        run(args)
+
+
+def run(args):
+    """
+    Run the conversion described by the parsed command-line arguments.
+    """
+    if args.incremental:
+        run_incremental(args)
+        return
 
-    args = parser.parse_args()
+    if args.stream:
+        transformed_data = stream_transform_data(args.input_file, args.rejected_file, all_entries=args.all_entries)
+    else:
+        # Read the JSON input file
+        with stage("read"), open_input(args.input_file) as f:
+            original_data = json.load(f)
 
-    # Read the JSON input file
-    with open(args.input_file, 'r') as f:
-        original_data = json.load(f)
+        # Transform the data
+        if args.all_entries:
+            transformed_data = transform_all_entries(original_data, args.rejected_file, args.workers)
+        else:
+            transformed_data = transform_data(original_data, args.rejected_file)
 
-    # Transform the data
-    transformed_data = transform_data(original_data, args.rejected_file)
+    # Export the transformed data to the output file(s)
+    if args.all_entries:
+        export_data_models(transformed_data, args.output_file, args.split, args.compact, args.compress)
+    else:
+        export_to_json(transformed_data, args.output_file, args.compact, args.compress)
+
+
+def run_incremental(args):
+    """
+    Incremental re-conversion: diff the result against the previous output and only rewrite the
+    output file when a variable actually changed, so that its consumers are not needlessly reloaded.
+    """
+    previous_data = read_from_json(args.output_file) if os.path.exists(args.output_file) else None
+
+    if args.stream:
+        transformed_data = stream_transform_data(args.input_file, args.rejected_file)
+    else:
+        with stage("read"):
+            original_data = read_from_json(args.input_file)
+        transformed_data = transform_data(original_data, args.rejected_file)
+
+    diff = diff_data_models(previous_data, transformed_data)
+    if args.diff:
+        export_to_json(diff, args.diff)
+    print(f"Variables added: {len(diff['added'])}, removed: {len(diff['removed'])}, changed: {len(diff['changed'])}")
+
+    if previous_data == transformed_data:
+        print(f"{args.output_file} is up to date")
+    else:
+        export_to_json(transformed_data, args.output_file, args.compact, args.compress)
 
-    # Export the transformed data to the output file
-    export_to_json(transformed_data, args.output_file)
 
 if __name__ == "__main__":
     main()
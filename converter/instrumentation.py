@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Comma-separated captures to enable for one run without touching the code: "cprofile", "tracemalloc"
+CAPTURE_ENV_VAR = "CONVERTER_CAPTURE"
+
+# Report written when captures are enabled through the environment but no report file was asked for
+DEFAULT_REPORT_FILE = "converter_profile.json"
+
+# Number of allocation sites listed in the report when tracemalloc is captured
+TOP_ALLOCATIONS = 20
+
+# Seconds between two reads of the peak RSS (one getrusage call) while recording stages
+RSS_SAMPLE_INTERVAL = 0.05
+
+_active_recorder = None
+_no_stage = nullcontext()
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of the process so far, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports kilobytes
+
+
+class StageRecorder:
+    """
+    Accumulate the wall time and memory of named stages. A stage entered several times
+    (e.g. once per batch) adds up its calls and time. With tracemalloc tracing, the peak of
+    Python allocations inside each stage is recorded too. Stages may run in several threads
+    (e.g. a pipelined conversion); their times then add up beyond the total wall time.
+    The peak RSS of a stage is the process peak when it last exited, sampled at most every
+    RSS_SAMPLE_INTERVAL seconds so that stages entered once per feature do not each cost a syscall.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._peak_rss = peak_rss_bytes()
+        self._peak_rss_time = self._start
+
+    @property
+    def _stack(self):
+        # Stages nest per thread
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Hand the peak reached so far to the enclosing stages before resetting it for this one
+            current_peak = tracemalloc.get_traced_memory()[1]
+            for frame in self._stack:
+                frame["traced_peak"] = max(frame["traced_peak"], current_peak)
+            tracemalloc.reset_peak()
+        frame = {"traced_peak": 0}
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            wall_time = end - start
+            self._stack.pop()
+            if tracing:
+                frame["traced_peak"] = max(frame["traced_peak"], tracemalloc.get_traced_memory()[1])
+                for parent in self._stack:
+                    parent["traced_peak"] = max(parent["traced_peak"], frame["traced_peak"])
+
+            if end - self._peak_rss_time >= RSS_SAMPLE_INTERVAL:
+                self._peak_rss, self._peak_rss_time = peak_rss_bytes(), end
+            with self._lock:
+                stats = self.stages.setdefault(name, {"calls": 0, "wall_time": 0.0, "peak_rss": None, "traced_peak": None})
+                stats["calls"] += 1
+                stats["wall_time"] += wall_time
+                stats["peak_rss"] = self._peak_rss
+                if tracing:
+                    stats["traced_peak"] = max(stats["traced_peak"] or 0, frame["traced_peak"])
+
+    def report(self):
+        """
+        Return the recorded stages as a JSON-serialisable dict.
+        """
+        return {
+            "total_wall_time": time.perf_counter() - self._start,
+            "peak_rss": peak_rss_bytes(),
+            "stages": self.stages,
+        }
+
+
+def stage(name):
+    """
+    Context manager recording the enclosed block as stage `name` of the active recording.
+    When nothing is recording it is a shared no-op, cheap enough for per-feature loops.
+    """
+    if _active_recorder is None:
+        return _no_stage
+    return _active_recorder.stage(name)
+
+
+def captures_from_env():
+    """
+    Captures requested through the CONVERTER_CAPTURE environment variable.
+    """
+    return {capture.strip().lower() for capture in os.environ.get(CAPTURE_ENV_VAR, "").split(",") if capture.strip()}
+
+
+def profiling(report_file=None):
+    """
+    recording(report_file) when a report file or a CONVERTER_CAPTURE capture was asked for, a no-op otherwise:
+    the command-line entry points wrap their whole run in it, and without a recorder every stage is free.
+    """
+    if report_file or captures_from_env():
+        return recording(report_file)
+    return nullcontext()
+
+
+@contextmanager
+def recording(report_file=None, captures=None):
+    """
+    Record the stages run inside the block and, if `report_file` is given, write them there as JSON.
+    `captures` (by default read from CONVERTER_CAPTURE) may enable "cprofile", whose stats are dumped
+    next to the report as '<report>.prof', and "tracemalloc", which adds per-stage allocation peaks
+    and the top allocation sites to the report.
+    """
+    global _active_recorder
+    captures = captures_from_env() if captures is None else set(captures)
+    if captures and not report_file:
+        report_file = DEFAULT_REPORT_FILE
+    unknown = captures - {"cprofile", "tracemalloc"}
+    if unknown:
+        raise ValueError(f"Unknown captures: {sorted(unknown)}. Expected 'cprofile' and/or 'tracemalloc'.")
+
+    recorder = StageRecorder()
+    previous_recorder, _active_recorder = _active_recorder, recorder
+    profiler = cProfile.Profile() if "cprofile" in captures else None
+    started_tracing = "tracemalloc" in captures and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield recorder
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _active_recorder = previous_recorder
+
+        report = recorder.report()
+        report["captures"] = sorted(captures)
+        if "tracemalloc" in captures:
+            snapshot = tracemalloc.take_snapshot()
+            report["top_allocations"] = [
+                {"location": str(statistic.traceback), "size": statistic.size, "count": statistic.count}
+                for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+            ]
+        if started_tracing:
+            tracemalloc.stop()
+
+        if report_file:
+            if profiler is not None:
+                profiler.dump_stats(f"{os.path.splitext(report_file)[0]}.prof")
+            with open(report_file, 'w') as json_file:
+                json.dump(report, json_file, indent=4)
+            print(f"Profile report has been written to {report_file}")
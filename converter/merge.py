@@ -0,0 +1,221 @@
+import sys
+import json
+import argparse
+
+from converter.fhir2mip import normalise_code, transform_entry, read_from_json, export_to_json
+from converter.instrumentation import stage
+
+# Attributes that must agree for the same variable to be merged across sites
+TYPE_ATTRIBUTES = ("type", "sql_type", "isCategorical")
+
+
+class _MergedVariable:
+    """
+    Variable being merged: the definition of the first site that has it, with the enumerations
+    of every site unioned (in first-seen order) and the min/max range widened. The range is only
+    kept when every site gave one: a site without a range may hold any value.
+    """
+
+    __slots__ = ("definition", "enumerations", "min_value", "max_value", "sites", "ranged_sites")
+
+    def __init__(self, variable, site):
+        self.definition = {key: value for key, value in variable.items()
+                           if key not in ("enumerations", "minValue", "maxValue")}
+        self.enumerations = {}
+        self.min_value = None
+        self.max_value = None
+        self.sites = []
+        self.ranged_sites = 0
+        self.add(variable, site)
+
+    def add(self, variable, site):
+        self.sites.append(site)
+        for enumeration in variable.get("enumerations", []):
+            self.enumerations.setdefault(enumeration["code"], enumeration["label"])
+        if "minValue" in variable and "maxValue" in variable:
+            self.ranged_sites += 1
+            self.min_value = variable["minValue"] if self.min_value is None else min(self.min_value, variable["minValue"])
+            self.max_value = variable["maxValue"] if self.max_value is None else max(self.max_value, variable["maxValue"])
+
+    def to_dict(self):
+        variable = dict(self.definition)
+        variable["enumerations"] = [{"code": code, "label": label} for code, label in self.enumerations.items()]
+        # Like transform_feature, a range whose min equals its max is left out
+        if self.ranged_sites == len(self.sites) and self.min_value != self.max_value:
+            variable["minValue"] = self.min_value
+            variable["maxValue"] = self.max_value
+        return variable
+
+
+class _MergedGroup:
+    __slots__ = ("code", "label", "variables", "groups")
+
+    def __init__(self, code, label):
+        self.code = code
+        self.label = label
+        self.variables = []  # Normalised codes of the variables first seen in this group
+        self.groups = {}
+
+    def to_dict(self, merged_variables):
+        group = {"code": self.code, "label": self.label,
+                 "variables": [merged_variables[code].to_dict() for code in self.variables]}
+        if self.groups:
+            group["groups"] = [subgroup.to_dict(merged_variables) for subgroup in self.groups.values()]
+        return group
+
+
+class SchemaMerger:
+    """
+    Build one federated data model out of the data models of many sites in a single pass.
+    Variables are indexed by normalised code, so every variable is merged with one dict lookup
+    and the cost grows linearly with the total number of variables, never pairwise between sites.
+    A variable keeps the type and group of the first site defining it; sites disagreeing on its
+    type are reported as conflicts and their values are not merged into it.
+    """
+
+    def __init__(self):
+        self.variables = {}
+        self.root = _MergedGroup(None, None)
+        self.datasets = {}
+        self.sites = []
+        self.conflicts = []
+
+    def add(self, data_model):
+        site = data_model.get("code")
+        self.sites.append(site)
+        # The top-level variables are the per-site 'dataset' variables
+        for variable in data_model.get("variables", []):
+            for enumeration in variable.get("enumerations", []):
+                self.datasets.setdefault(enumeration["code"], enumeration["label"])
+        self._add_groups(data_model.get("groups", []), self.root, site)
+
+    def _add_groups(self, groups, parent, site):
+        for group in groups:
+            merged_group = parent.groups.get(group["code"])
+            if merged_group is None:
+                merged_group = parent.groups[group["code"]] = _MergedGroup(group["code"], group.get("label"))
+            for variable in group.get("variables", []):
+                self._add_variable(variable, merged_group, site)
+            self._add_groups(group.get("groups", []), merged_group, site)
+
+    def _add_variable(self, variable, group, site):
+        code = normalise_code(variable["code"])
+        merged = self.variables.get(code)
+        if merged is None:
+            self.variables[code] = merged = _MergedVariable(variable, site)
+            merged.definition["code"] = code
+            group.variables.append(code)
+            return
+
+        expected = {attribute: merged.definition.get(attribute) for attribute in TYPE_ATTRIBUTES}
+        found = {attribute: variable.get(attribute) for attribute in TYPE_ATTRIBUTES}
+        if found != expected:
+            self.conflicts.append({"code": code, "site": site, "first_site": merged.sites[0],
+                                   "expected": expected, "found": found})
+            return
+        merged.add(variable, site)
+
+    def result(self, code="federated", version="1.0", label=None):
+        """
+        Return the federated data model and a merge report (sites, variable counts, type conflicts).
+        """
+        dataset_variable = {
+            "code": "dataset",
+            "label": "Dataset Variable",
+            "description": "The dataset from which the variables are sourced.",
+            "sql_type": "text",
+            "isCategorical": True,
+            "enumerations": [{"code": dataset, "label": dataset_label} for dataset, dataset_label in self.datasets.items()],
+            "type": "nominal",
+            "methodology": "Automatically generated to represent the dataset names of all sites",
+            "units": ""
+        }
+        data_model = {
+            "code": code,
+            "version": version,
+            "label": label or code,
+            "longitudinal": False,
+            "variables": [dataset_variable],
+            "groups": [group.to_dict(self.variables) for group in self.root.groups.values()]
+        }
+        report = {
+            "sites": self.sites,
+            "variables": len(self.variables),
+            "shared_by_all_sites": sum(1 for merged in self.variables.values()
+                                       if len(set(merged.sites)) == len(set(self.sites))),
+            "type_conflicts": self.conflicts,
+        }
+        return data_model, report
+
+
+def merge_data_models(data_models, code="federated", version="1.0", label=None):
+    """
+    Merge the data models of many sites into one federated data model, see SchemaMerger.
+    Returns the data model and the merge report.
+    """
+    merger = SchemaMerger()
+    with stage("merge"):
+        for data_model in data_models:
+            merger.add(data_model)
+        return merger.result(code, version, label)
+
+
+def _with_raw_ranges(data_model, dataset):
+    """
+    Put back the range transform_feature leaves out of numeric features whose min equals their max
+    (e.g. a site where every value is 50), from their raw statistics, so that they still widen the
+    federated range instead of leaving it unbounded.
+    """
+    ranges = {}
+    for feature in dataset["featureSet"]["features"] + dataset["featureSet"].get("outcomes", []):
+        statistics = feature.get("statistics", {})
+        if feature.get("dataType") == "NUMERIC" and "min" in statistics and "max" in statistics:
+            ranges[normalise_code(feature["name"])] = (statistics["min"], statistics["max"])
+    for group in data_model["groups"]:
+        for variable in group["variables"]:
+            if not variable.has_range and variable.code in ranges:
+                variable.has_range = True
+                variable.min_value, variable.max_value = ranges[variable.code]
+    return data_model
+
+
+def iter_data_models(paths):
+    """
+    Load data models from JSON files holding a data model, a list of data models, or a raw FHIR
+    feature-set bundle, whose entries are transformed on the fly (rejected features are left out,
+    the raw min/max of every numeric feature is kept).
+    """
+    for path in paths:
+        data = read_from_json(path)
+        if isinstance(data, list):
+            yield from data
+        elif "entries" in data:
+            for dataset in data["entries"]:
+                yield _with_raw_ranges(transform_entry(dataset)[0], dataset)
+        else:
+            yield data
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Merge the data models of many sites into one federated data model")
+    parser.add_argument("output_file", help="The federated data model JSON file")
+    parser.add_argument("inputs", nargs="+", help="Data model or raw FHIR feature-set JSON files")
+    parser.add_argument("--code", default="federated", help="Code of the federated data model")
+    parser.add_argument("--version", default="1.0", help="Version of the federated data model")
+    parser.add_argument("--report", help="Write the merge report (including type conflicts) to this JSON file")
+
+    args = parser.parse_args(argv)
+
+    data_model, report = merge_data_models(iter_data_models(args.inputs), args.code, args.version)
+    export_to_json(data_model, args.output_file)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=4)
+    print(f"Merged {len(report['sites'])} site(s) into {report['variables']} variables, "
+          f"{len(report['type_conflicts'])} type conflict(s)")
+    if report["type_conflicts"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import sys
+from collections.abc import Mapping
+
+
+class Enumerations:
+    """
+    Compact list of enumerations: the codes are kept as one tuple of interned strings (shared by
+    every variable using the same code) and the labels only when they differ from the codes,
+    instead of one {"code": ..., "label": ...} dict per value.
+    """
+
+    __slots__ = ("codes", "labels")
+
+    def __init__(self, codes, labels=None):
+        self.codes = tuple(sys.intern(code) if isinstance(code, str) else code for code in codes)
+        self.labels = None if labels is None or list(labels) == list(self.codes) else tuple(labels)
+
+    @classmethod
+    def from_dicts(cls, enumerations):
+        return cls([enumeration["code"] for enumeration in enumerations],
+                   [enumeration["label"] for enumeration in enumerations])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def to_dicts(self):
+        labels = self.codes if self.labels is None else self.labels
+        return [{"code": code, "label": label} for code, label in zip(self.codes, labels)]
+
+
+# Shared by every BOOLEAN feature
+BOOLEAN_ENUMERATIONS = Enumerations(["True", "False"])
+NO_ENUMERATIONS = Enumerations([])
+
+
+class Variable(Mapping):
+    """
+    Slotted representation of a MIP variable. It reads like the plain variable dict
+    ('code', 'label', ..., 'enumerations', 'minValue', 'maxValue') and compares equal to it,
+    but only turns into a dict, with the same key order, when serialised through to_dict.
+    """
+
+    __slots__ = ("code", "label", "description", "sql_type", "is_categorical", "type", "methodology", "units",
+                 "enumerations", "min_value", "max_value", "has_range")
+
+    # Serialised key -> slot, in the order the keys are written
+    _KEYS = {
+        "code": "code",
+        "label": "label",
+        "description": "description",
+        "sql_type": "sql_type",
+        "isCategorical": "is_categorical",
+        "type": "type",
+        "methodology": "methodology",
+        "units": "units",
+        "enumerations": "enumerations",
+    }
+    _RANGE_KEYS = {"minValue": "min_value", "maxValue": "max_value"}
+
+    def __init__(self, code, label, description, sql_type, is_categorical, type, methodology="", units="",
+                 enumerations=NO_ENUMERATIONS, has_range=False, min_value=None, max_value=None):
+        self.code = code
+        self.label = label
+        self.description = description
+        self.sql_type = sql_type
+        self.is_categorical = is_categorical
+        self.type = type
+        self.methodology = methodology
+        self.units = units
+        self.enumerations = enumerations
+        self.has_range = has_range
+        self.min_value = min_value
+        self.max_value = max_value
+
+    @classmethod
+    def from_dict(cls, variable):
+        """
+        Build a Variable back from its dict form (as written by to_dict).
+        """
+        return cls(variable["code"], variable["label"], variable["description"], variable["sql_type"],
+                   variable["isCategorical"], variable["type"], variable["methodology"], variable["units"],
+                   Enumerations.from_dicts(variable["enumerations"]), "minValue" in variable,
+                   variable.get("minValue"), variable.get("maxValue"))
+
+    def __getitem__(self, key):
+        slot = self._KEYS.get(key) or (self.has_range and self._RANGE_KEYS.get(key))
+        if not slot:
+            raise KeyError(key)
+        if slot == "enumerations":
+            return self.enumerations.to_dicts()
+        return getattr(self, slot)
+
+    def __iter__(self):
+        yield from self._KEYS
+        if self.has_range:
+            yield from self._RANGE_KEYS
+
+    def __len__(self):
+        return len(self._KEYS) + (len(self._RANGE_KEYS) if self.has_range else 0)
+
+    def __repr__(self):
+        return f"Variable({self.to_dict()!r})"
+
+    def to_dict(self):
+        """
+        Plain dict form of the variable, as exported to JSON.
+        """
+        return {key: self[key] for key in self}
+
+
+def to_serialisable(value):
+    """
+    `default` hook for JSON encoders: turn Variables (and other mappings) into plain dicts.
+    """
+    if isinstance(value, Variable):
+        return value.to_dict()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
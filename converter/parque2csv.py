@@ -1,145 +1,665 @@
-import pandas as pd
+import io
+import os
+import re
+import csv
+import json
+import fnmatch
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
-def parquet_to_csv(parquet_file, csv_file, columns_to_remove=None):
-    # Read the Parquet file into a DataFrame
-    df = pd.read_parquet(parquet_file)
-    encounters_columns = df.filter(like='cause_of_death')
+from converter.compression import open_output, compression_of, strip_compression_extension, EXTENSIONS
+from converter.fhir2mip import transform_feature, build_data_model, write_rejected_codes, normalise_code, sql_type_of, \
+    export_to_json
+from converter.instrumentation import stage, profiling
+from converter.pipeline import background, BackgroundWriter, DEFAULT_QUEUE_SIZE
 
-    total = 0
-    # Loop through all columns in the DataFrame
-    for col in df.columns:
-        if df[col].dtype == 'object' or df[
-            col].dtype == 'bool':  # Check if the column contains string or boolean values
-            # Convert column to string type to avoid errors, then check for 'True'
-            true_count = df[col].astype(str).str.contains('True', na=False).sum()
-            total += true_count
-            if true_count > 0:
-                print(f"Column '{col}' has {true_count} rows with the string 'True'.")
+# Number of rows converted at a time; memory use is proportional to this, not to the size of the cohort
+DEFAULT_BATCH_SIZE = 64 * 1024
 
-    print(f"Total number of encounters: {total}")
-    df["dataset"] = "study1"
+# Rows serialised per write to the CSV file: fewer calls into Python file objects than Arrow's default of
+# 1024, while the serialised text of a whole batch is never held in memory at once
+CSV_WRITE_ROWS = 8192
 
-    # Remove specified columns if any are provided
-    if columns_to_remove:
-        df = df.drop(columns=columns_to_remove)
-    df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('-', '_')
+# Distinct values tracked per column while profiling; beyond this the distinct count is reported as None
+DEFAULT_MAX_DISTINCT = 100_000
 
-    # Write the DataFrame to a CSV file
-    # df.to_csv(csv_file, index=False)
-    print(f"Conversion complete: {parquet_file} -> {csv_file}")
+
+def compile_drop_patterns(columns_to_remove, schema_names=()):
+    """
+    Split `columns_to_remove` into exact column names and one compiled regular expression
+    matching every pattern. Entries containing '*', '?' or '[' are globs (e.g. '*_stddev') unless
+    they are the exact name of one of `schema_names` (e.g. 'weight [kg]'), entries prefixed with 're:'
+    and compiled re.Pattern objects are regular expressions; patterns must match the whole column name.
+    """
+    schema_names = set(schema_names)
+    names = set()
+    patterns = []
+    for column in columns_to_remove or []:
+        if isinstance(column, re.Pattern):
+            patterns.append(column.pattern)
+        elif column.startswith("re:"):
+            patterns.append(column[len("re:"):])
+        elif column not in schema_names and any(char in column for char in "*?["):
+            patterns.append(fnmatch.translate(column))
+        else:
+            names.add(column)
+
+    regex = re.compile("|".join(f"(?:{pattern})" for pattern in patterns)) if patterns else None
+    return names, regex
+
+
+def columns_to_keep(schema_names, columns_to_remove):
+    """
+    Work out from the Parquet schema, before reading any data, which columns survive `columns_to_remove`.
+    Returns the kept columns and whether the added 'dataset' column survives too.
+    """
+    names, regex = compile_drop_patterns(columns_to_remove, schema_names)
+
+    # Fail before writing anything rather than halfway through the file
+    missing_columns = names - set(schema_names) - {"dataset"}
+    if missing_columns:
+        raise KeyError(f"Columns to remove not found: {sorted(missing_columns)}")
+
+    def is_dropped(column):
+        return column in names or (regex is not None and regex.fullmatch(column) is not None)
+
+    kept_columns = [column for column in schema_names if not is_dropped(column) and column != "dataset"]
+    return kept_columns, not is_dropped("dataset")
+
+
+class ColumnProfiler:
+    """
+    Accumulate the statistics of one column over successive Arrow arrays, computed with
+    Arrow compute kernels directly on the column buffers: row, null, 'True' and distinct counts, min and max.
+    Booleans count their true values, strings the values containing 'True'.
+    Nested columns (lists, structs, maps) have no distinct or min/max kernels: only their rows and nulls are counted.
+    Dictionary-encoded columns are profiled on the dictionary values they use, weighted by their
+    number of rows, without ever decoding the rows themselves.
+    """
+
+    def __init__(self, data_type, max_distinct=DEFAULT_MAX_DISTINCT):
+        self.data_type = data_type
+        self.max_distinct = max_distinct
+        self.rows = 0
+        self.null_count = 0
+        self.true_count = 0 if _counts_true(data_type) else None
+        self.min = None
+        self.max = None
+        self._distinct = pa.array([], type=_value_type(data_type))
+        self._distinct_overflow = False
+        self._nested = pa.types.is_nested(_value_type(data_type))
+
+    def update(self, array):
+        self.rows += len(array)
+        self.null_count += array.null_count
+        if len(array) == array.null_count or self._nested:
+            return
+
+        weights = None
+        if pa.types.is_dictionary(array.type):
+            value_counts = pc.value_counts(array.indices.drop_null())
+            array = array.dictionary.take(value_counts.field("values"))
+            weights = value_counts.field("counts")
+
+        if pa.types.is_boolean(self.data_type):
+            self.true_count += pc.sum(array).as_py() or 0
+        elif self.true_count is not None:
+            matches = pc.match_substring(array, "True")
+            if weights is not None:
+                matches = pc.if_else(matches, weights, 0)
+            self.true_count += pc.sum(matches).as_py() or 0
+
+        try:
+            min_max = pc.min_max(array)
+        except (pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            pass  # Nested and other unordered types have no min/max
+        else:
+            batch_min, batch_max = min_max["min"].as_py(), min_max["max"].as_py()
+            self.min = batch_min if self.min is None else min(self.min, batch_min)
+            self.max = batch_max if self.max is None else max(self.max, batch_max)
+
+        if not self._distinct_overflow:
+            distinct = pc.unique(pa.concat_arrays([self._distinct, pc.unique(array.drop_null())]))
+            if len(distinct) > self.max_distinct:
+                self._distinct_overflow = True
+                self._distinct = pa.array([], type=_value_type(self.data_type))
+            else:
+                self._distinct = distinct
+
+    def distinct_values(self):
+        """
+        Return the sorted distinct non-null values seen so far, or None if there were more than `max_distinct`.
+        """
+        if self._distinct_overflow or self._nested:
+            return None
+        return sorted(self._distinct.to_pylist(), key=lambda value: (str(type(value)), value))
+
+    def result(self):
+        """
+        Return the statistics gathered so far as a JSON-serialisable dict.
+        """
+        return {
+            "type": str(self.data_type),
+            "rows": self.rows,
+            "null_count": self.null_count,
+            "true_count": self.true_count,
+            "distinct_count": None if self._distinct_overflow or self._nested else len(self._distinct),
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+def _value_type(data_type):
+    """
+    Type of the values of a column: the dictionary value type for dictionary-encoded columns.
+    """
+    return data_type.value_type if pa.types.is_dictionary(data_type) else data_type
+
+
+def _counts_true(data_type):
+    data_type = _value_type(data_type)
+    return pa.types.is_boolean(data_type) or pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+
+def profile_batches(batches, schema, workers=None, max_distinct=DEFAULT_MAX_DISTINCT):
+    """
+    Profile every column of `schema` over an iterable of record batches, profiling the columns
+    of each batch in parallel threads (Arrow kernels release the GIL). Batches are yielded back
+    unchanged, so profiling can run inline with a conversion; the profilers are updated in place
+    and must be read once the batches are exhausted.
+    """
+    profilers = {field.name: ColumnProfiler(field.type, max_distinct) for field in schema}
+    workers = workers or min(len(profilers), os.cpu_count() or 1) or 1
+
+    def generator():
+        iterator = iter(batches)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                with stage("parquet_read"):
+                    batch = next(iterator, None)
+                if batch is None:
+                    return
+                with stage("profile"):
+                    list(executor.map(lambda name: profilers[name].update(batch.column(name)), profilers))
+                yield batch
+
+    return profilers, generator()
+
+
+def build_profile(profilers, source):
+    """
+    Build the machine-readable profile of `source` out of its column profilers.
+    """
+    columns = {name: profiler.result() for name, profiler in profilers.items()}
+    return {
+        "source": str(source),
+        "rows": next(iter(columns.values()))["rows"] if columns else 0,
+        "columns": columns,
+    }
+
+
+def write_profile(profile, profile_file):
+    """
+    Write a profile as JSON; values JSON cannot represent (dates, decimals) are written as strings.
+    """
+    with open(profile_file, 'w') as json_file:
+        json.dump(profile, json_file, indent=4, default=str)
+
+
+def profile_parquet(parquet_file, columns=None, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+                    max_distinct=DEFAULT_MAX_DISTINCT):
+    """
+    Profile the columns of a Parquet file (all of them, or only `columns`) without converting it.
+    """
+    parquet = pq.ParquetFile(parquet_file)
+    schema = parquet.schema_arrow
+    if columns is not None:
+        schema = pa.schema([schema.field(column) for column in columns])
+
+    profilers, batches = profile_batches(parquet.iter_batches(batch_size=batch_size, columns=schema.names),
+                                         schema, workers, max_distinct)
+    for _ in batches:
+        pass
+    return build_profile(profilers, parquet_file)
+
+
+# File extensions of the columnar output formats; anything else is written as CSV
+OUTPUT_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+# Arrow type of the output columns for each MIP sql_type
+SQL_TYPE_TO_ARROW = {"text": pa.string(), "real": pa.float64(), "int": pa.int64()}
+
+
+def output_format_of(output_file):
+    """
+    Output format ("csv", "parquet" or "arrow") implied by the extension of the output file,
+    ignoring a compression extension ('cohort.csv.gz' is CSV).
+    """
+    return OUTPUT_FORMATS.get(os.path.splitext(strip_compression_extension(output_file))[1].lower(), "csv")
+
+
+def feature_data_type(arrow_type):
+    """
+    FHIR dataType of a column: booleans are BOOLEAN, numbers NUMERIC, anything else NOMINAL.
+    """
+    arrow_type = _value_type(arrow_type)
+    if pa.types.is_boolean(arrow_type):
+        return "BOOLEAN"
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return "NUMERIC"
+    return "NOMINAL"
+
+
+def _to_sql_type(array, arrow_type):
+    """
+    Cast a column to the Arrow type of its MIP sql_type; booleans are spelled 'True'/'False' like in the CSV
+    and nested values, which Arrow cannot cast to strings, are written as JSON.
+    """
+    if pa.types.is_boolean(array.type) or pa.types.is_nested(array.type):
+        return _csv_column(array)
+    return array if array.type == arrow_type else pc.cast(array, arrow_type)
+
+
+def _csv_column(array):
+    """
+    Column as written to CSV: booleans are spelled 'True'/'False', the codes of their enumerations, and nested
+    values, which Arrow can neither cast to strings nor write as CSV, are written as JSON.
+    """
+    if pa.types.is_boolean(array.type):
+        return pc.if_else(array, "True", "False")
+    if pa.types.is_nested(array.type):
+        return pa.array([None if value is None else json.dumps(value, default=str) for value in array.to_pylist()],
+                        pa.string())
+    return array
+
+
+def _boolean_codes(array):
+    """
+    Dictionary-encode a boolean column as the 'True'/'False' codes, keeping its nulls.
+    """
+    return pa.DictionaryArray.from_arrays(pc.cast(pc.invert(array), pa.int8()), pa.array(["True", "False"]))
+
+
+def _dataset_column(dataset_name, num_rows):
+    """
+    Dictionary-encoded 'dataset' column: one int8 index per row instead of one string.
+    """
+    return pa.DictionaryArray.from_arrays(pc.fill_null(pa.nulls(num_rows, pa.int8()), 0), pa.array([dataset_name]))
+
+
+def _narrow_indices(array):
+    """
+    Store the indices of a dictionary-encoded column in the smallest integer type fitting its dictionary
+    (the Parquet reader always uses int32, four bytes per row for a handful of codes).
+    """
+    for index_type in (pa.int8(), pa.int16()):
+        if len(array.dictionary) <= 2 ** (index_type.bit_width - 1):
+            return pa.DictionaryArray.from_arrays(pc.cast(array.indices, index_type), array.dictionary)
+    return array
+
+
+def _categorical_batch(batch, dataset_name, keep_dataset):
+    """
+    Dictionary-encode the boolean columns of a batch and append a dictionary-encoded 'dataset' column,
+    so that, like the string columns read as dictionaries, they are held as small integer codes and not
+    one string per cell.
+    """
+    columns = [_boolean_codes(column) if pa.types.is_boolean(column.type)
+               else _narrow_indices(column) if pa.types.is_dictionary(column.type)
+               else column for column in batch.columns]
+    names = list(batch.schema.names)
+    if keep_dataset:
+        columns.append(_dataset_column(dataset_name, batch.num_rows))
+        names.append("dataset")
+    return pa.RecordBatch.from_arrays(columns, names=names)
+
+
+def _write_csv_batches(batches, csv_file, kept_schema, dataset_name, keep_dataset, writer_queue_size=None,
+                       dictionary=False, compression=None):
+    """
+    Write the batches as CSV with Arrow's CSV writer. It serialises in C++ without holding the GIL, so
+    that with a pipeline the writing of one batch really overlaps the reading and conversion of the next.
+    The header is written once from the schema; string values are quoted.
+    """
+    header = [normalise_code(field.name) for field in kept_schema] + (["dataset"] if keep_dataset else [])
+    write_options = pa_csv.WriteOptions(include_header=False, batch_size=CSV_WRITE_ROWS)
+
+    with open_output(csv_file, mode='wb', compression=compression) as csv_output:
+        header_line = io.StringIO()
+        csv.writer(header_line, lineterminator="\n").writerow(header)
+        csv_output.write(header_line.getvalue().encode("utf-8"))
+
+        def write(output_batch):
+            with stage("csv_write"):
+                pa_csv.write_csv(output_batch, csv_output, write_options)
+
+        with _writer(write, writer_queue_size) as writer:
+            for batch in batches:
+                with stage("drop_rename"):
+                    if dictionary:
+                        batch = _categorical_batch(batch, dataset_name, keep_dataset)
+                    columns = [_csv_column(column) for column in batch.columns]
+                    if keep_dataset and not dictionary:
+                        columns.append(_dataset_column(dataset_name, batch.num_rows))
+                    output_batch = pa.RecordBatch.from_arrays(columns, names=header)
+                writer.submit(output_batch)
+
+
+def _write_arrow_batches(batches, output_file, output_format, kept_schema, dataset_name, keep_dataset,
+                         writer_queue_size=None):
+    """
+    Write the batches as Parquet or Arrow IPC, renamed like the CSV columns, with every column
+    typed after the MIP sql_type transform_feature gives it and the 'dataset' column appended.
+    """
+    arrow_types = [SQL_TYPE_TO_ARROW[sql_type_of(feature_data_type(field.type))] for field in kept_schema]
+    fields = [pa.field(normalise_code(field.name), arrow_type) for field, arrow_type in zip(kept_schema, arrow_types)]
+    if keep_dataset:
+        fields.append(pa.field("dataset", pa.string()))
+    output_schema = pa.schema(fields)
+
+    if output_format == "parquet":
+        file_writer = pq.ParquetWriter(output_file, output_schema)
+    else:
+        file_writer = pa.ipc.new_file(output_file, output_schema)
+
+    def write(output_batch):
+        with stage(f"{output_format}_write"):
+            file_writer.write_batch(output_batch)
+
+    with file_writer, _writer(write, writer_queue_size) as writer:
+        for batch in batches:
+            with stage("drop_rename"):
+                columns = [_to_sql_type(column, arrow_type) for column, arrow_type in zip(batch.columns, arrow_types)]
+                if keep_dataset:
+                    columns.append(pc.cast(_dataset_column(dataset_name, batch.num_rows), pa.string()))
+                output_batch = pa.RecordBatch.from_arrays(columns, schema=output_schema)
+            writer.submit(output_batch)
+
+
+class _InlineWriter:
+    """
+    Same interface as BackgroundWriter, writing each item right away in the calling thread.
+    """
+
+    def __init__(self, write):
+        self.submit = write
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+def _writer(write, queue_size):
+    return _InlineWriter(write) if queue_size is None else BackgroundWriter(write, queue_size)
+
+
+def null_columns(parquet, columns):
+    """
+    Return those of `columns` that are null in every row of a pq.ParquetFile, after the null counts of
+    the row group statistics in its footer, without reading any data. Columns lacking statistics in any
+    row group (or nested, with statistics on their leaves only) are assumed to hold values.
+    """
+    metadata = parquet.metadata
+    if not metadata.num_rows:
+        return set()
+    null_counts = dict.fromkeys(columns, 0)
+    for index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(index)
+        for column_index in range(row_group.num_columns):
+            chunk = row_group.column(column_index)
+            column = chunk.path_in_schema
+            if null_counts.get(column) is None:
+                continue
+            statistics = chunk.statistics
+            if statistics is None or not statistics.has_null_count:
+                null_counts[column] = None
+            else:
+                null_counts[column] += statistics.null_count
+    return {column for column, null_count in null_counts.items() if null_count == metadata.num_rows}
+
+
+def _convert(parquet_file, output_file, columns_to_remove, dataset_name, batch_size, workers, output_format=None,
+             pipeline=False, queue_size=DEFAULT_QUEUE_SIZE, dictionary=False, compression=None,
+             drop_null_columns=False):
+    """
+    Single streaming pass over a Parquet file: project, profile and append every batch to the
+    output, written as CSV, Parquet or Arrow IPC (by default after the output file extension).
+    With `pipeline`, a reader thread prefetches (and profiles) the next batches and a writer thread
+    serialises the previous ones while the current batch is transformed, linked by queues of
+    `queue_size` batches so that memory stays capped.
+    With `dictionary`, string columns are read dictionary-encoded and stay so (along with the boolean
+    and 'dataset' columns) until they are written, instead of holding one string per cell; their
+    valuesets come straight from the dictionary values.
+    CSV output is compressed with `compression` ("gzip" or "zstd", by default after a '.gz'/'.zst'
+    extension of the output file) in parallel blocks, see open_output.
+    With `drop_null_columns`, the columns null in every row (see null_columns) are not exported either.
+    Returns the column profilers of every kept column, filled once the whole file has been written;
+    those of dropped null columns are filled from the footer right away.
+    """
+    parquet = pq.ParquetFile(parquet_file)
+    schema = parquet.schema_arrow
+    kept_columns, keep_dataset = columns_to_keep(schema.names, columns_to_remove)
+    empty_profilers = {}
+    if drop_null_columns:
+        for column in null_columns(parquet, kept_columns):
+            profiler = empty_profilers[column] = ColumnProfiler(schema.field(column).type)
+            profiler.rows = profiler.null_count = parquet.metadata.num_rows
+    profiled_columns = kept_columns
+    kept_columns = [column for column in kept_columns if column not in empty_profilers]
+    if dictionary:
+        string_columns = [column for column in kept_columns
+                          if pa.types.is_string(schema.field(column).type)
+                          or pa.types.is_large_string(schema.field(column).type)]
+        parquet = pq.ParquetFile(parquet_file, read_dictionary=string_columns)
+        schema = parquet.schema_arrow
+
+    kept_schema = pa.schema([schema.field(column) for column in kept_columns])
+    profilers, batches = profile_batches(parquet.iter_batches(batch_size=batch_size, columns=kept_columns),
+                                         kept_schema, workers)
+
+    output_format = output_format or output_format_of(output_file)
+    if output_format not in ("csv", "parquet", "arrow"):
+        raise ValueError(f"Invalid output format: {output_format}. Expected one of 'csv', 'parquet', 'arrow'.")
+    compression = compression or compression_of(output_file)
+    if compression and output_format != "csv":
+        raise ValueError(f"Only CSV output can be compressed; {output_format} files compress their own pages.")
+
+    writer_queue_size = None
+    if pipeline:
+        batches = background(batches, queue_size)
+        writer_queue_size = queue_size
+
+    if output_format == "csv":
+        _write_csv_batches(batches, output_file, kept_schema, dataset_name, keep_dataset, writer_queue_size,
+                           dictionary, compression)
+    else:
+        _write_arrow_batches(batches, output_file, output_format, kept_schema, dataset_name, keep_dataset,
+                             writer_queue_size)
+
+    if empty_profilers:
+        profilers = {column: profilers.get(column) or empty_profilers[column] for column in profiled_columns}
+    return profilers
+
+
+def parquet_to_csv(parquet_file, csv_file, columns_to_remove=None, dataset_name="study1",
+                   batch_size=DEFAULT_BATCH_SIZE, profile_file=None, workers=None, pipeline=False,
+                   queue_size=DEFAULT_QUEUE_SIZE, dictionary=False, compression=None):
+    """
+    Stream a Parquet file into a CSV file, one batch of at most `batch_size` rows at a time,
+    dropping `columns_to_remove`, adding the 'dataset' column and normalising the column names.
+    Memory stays flat no matter how many rows the file holds. Dropped columns (exact names or
+    glob/regex patterns, see compile_drop_patterns) are never read or decoded.
+    The kept columns are profiled on the way (see profile_batches); the profile is returned
+    and, if `profile_file` is given, written there as JSON.
+    With `pipeline`, reading, transforming and writing overlap in separate threads, and with
+    `dictionary` repeated codes stay dictionary-encoded to keep memory low (see _convert).
+    """
+    return convert_parquet(parquet_file, csv_file, columns_to_remove, dataset_name, batch_size, profile_file,
+                           workers, output_format="csv", pipeline=pipeline, queue_size=queue_size,
+                           dictionary=dictionary, compression=compression)
+
+
+def convert_parquet(parquet_file, output_file, columns_to_remove=None, dataset_name="study1",
+                    batch_size=DEFAULT_BATCH_SIZE, profile_file=None, workers=None, output_format=None,
+                    pipeline=False, queue_size=DEFAULT_QUEUE_SIZE, dictionary=False, compression=None):
+    """
+    Same conversion as parquet_to_csv, but the output may also be written as Parquet or Arrow IPC
+    ('.parquet', '.arrow'/'.feather'/'.ipc' extensions, or `output_format`), keeping typed columns
+    that MIP can ingest without parsing text again.
+    """
+    profilers = _convert(parquet_file, output_file, columns_to_remove, dataset_name, batch_size, workers,
+                         output_format, pipeline, queue_size, dictionary, compression)
+
+    profile = build_profile(profilers, parquet_file)
+    if profile_file:
+        write_profile(profile, profile_file)
+
+    print(f"Conversion complete: {parquet_file} -> {output_file}")
+    return profile
+
+
+def _json_scalar(value):
+    """
+    Turn an Arrow scalar value into something the JSON exporter can write (decimals become floats, dates strings).
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, "as_integer_ratio"):
+        return float(value)
+    return str(value)
+
+
+def feature_from_profile(name, profiler):
+    """
+    Describe a profiled column as a FHIR feature, with the statistics transform_feature expects.
+    Booleans become BOOLEAN, numbers NUMERIC (with min/max), anything else NOMINAL with its
+    distinct values as valueset (omitted when there were too many to track).
+    """
+    feature_type = feature_data_type(profiler.data_type)
+    statistics = {"numOfNotNull": profiler.rows - profiler.null_count}
+
+    if feature_type == "NUMERIC":
+        if profiler.min is not None:
+            statistics["min"] = _json_scalar(profiler.min)
+            statistics["max"] = _json_scalar(profiler.max)
+    elif feature_type == "NOMINAL":
+        distinct_values = profiler.distinct_values()
+        if distinct_values is not None:
+            statistics["valueset"] = [str(_json_scalar(value)) for value in distinct_values]
+
+    return {"name": name, "description": name, "dataType": feature_type, "statistics": statistics}
+
+
+def parquet_to_mip(parquet_file, output_file, rejected_file_path, columns_to_remove=None, dataset_name="study1",
+                   version="1.0", outcome_columns=None, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+                   output_format=None, pipeline=False, queue_size=DEFAULT_QUEUE_SIZE, dictionary=False,
+                   compression=None):
+    """
+    Convert a Parquet file to CSV (or Parquet/Arrow IPC, see convert_parquet) and build its MIP data
+    model in the same single pass. The statistics transform_feature needs (not-null counts, min/max,
+    valuesets) are collected from the exported batches themselves, so the schema always matches the rows.
+    Columns null in every row are rejected by transform_feature, so they are not exported either.
+    Columns listed in `outcome_columns` go to the outcomes group, every other kept column to the features group.
+    """
+    profilers = _convert(parquet_file, output_file, columns_to_remove, dataset_name, batch_size, workers,
+                         output_format, pipeline, queue_size, dictionary, compression, drop_null_columns=True)
+
+    outcome_columns = set(outcome_columns or [])
+    rejected_codes = []
+    feature_variables = []
+    outcome_variables = []
+    with stage("build_schema"):
+        for name, profiler in profilers.items():
+            variables = outcome_variables if name in outcome_columns else feature_variables
+            variables.append(transform_feature(feature_from_profile(name, profiler), rejected_codes))
+
+        dataset = {"name": dataset_name, "meta": {"versionId": version}}
+        transformed_data = build_data_model(dataset, feature_variables, outcome_variables)
+    write_rejected_codes(rejected_codes, rejected_file_path)
+
+    print(f"Conversion complete: {parquet_file} -> {output_file}")
+    return transformed_data
+
+
+def _columns_to_remove(args):
+    columns = list(args.drop or [])
+    if args.drop_file:
+        with open(args.drop_file, 'r') as f:
+            columns.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return columns
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Convert a Parquet file to MIP-ready CSV, Parquet or Arrow IPC data")
+    parser.add_argument("parquet_file", help="The input Parquet file")
+    parser.add_argument("output_file", help="The output data file ('.csv', '.parquet', '.arrow'/'.feather'/'.ipc')")
+    parser.add_argument("--drop", action="append", metavar="COLUMN",
+                        help="Column to leave out; globs and 're:' regular expressions are accepted (repeatable)")
+    parser.add_argument("--drop-file", help="File listing the columns to leave out, one per line")
+    parser.add_argument("--dataset", default="study1", help="Dataset name written in the 'dataset' column")
+    parser.add_argument("--format", choices=sorted(set(OUTPUT_FORMATS.values()) | {"csv"}),
+                        help="Output format (defaults to the one of the output file extension)")
+    parser.add_argument("--schema", metavar="DATA_MODEL_FILE",
+                        help="Also build the MIP data model of the exported columns and write it to this JSON file")
+    parser.add_argument("--rejected-file", default="rejected_codes.txt",
+                        help="With --schema, the file to save rejected column codes")
+    parser.add_argument("--outcome", action="append", metavar="COLUMN",
+                        help="With --schema, column placed in the outcomes group (repeatable)")
+    parser.add_argument("--version", default="1.0", help="With --schema, version of the data model")
+    parser.add_argument("--column-profile", help="Write the per-column statistics to this JSON file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows read at a time")
+    parser.add_argument("--workers", type=int, default=None, help="Number of threads profiling the columns")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap reading, transforming and writing the batches in separate threads")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="With --pipeline, batches buffered between two stages")
+    parser.add_argument("--compress", choices=sorted(EXTENSIONS),
+                        help="Compress CSV output in parallel blocks (implied by a '.gz'/'.zst' output file name)")
+    parser.add_argument("--dictionary", action="store_true",
+                        help="Low-memory mode: keep string and boolean columns dictionary-encoded from read to write")
+    parser.add_argument("--profile", metavar="REPORT_FILE",
+                        help="Write the time and memory spent in each stage to this JSON report")
+
+    args = parser.parse_args(argv)
+    if args.schema and args.column_profile:
+        parser.error("--column-profile cannot be combined with --schema")
+
+    options = dict(columns_to_remove=_columns_to_remove(args), dataset_name=args.dataset,
+                   batch_size=args.batch_size, workers=args.workers, output_format=args.format,
+                   pipeline=args.pipeline, queue_size=args.queue_size, dictionary=args.dictionary,
+                   compression=args.compress)
+    with profiling(args.profile):
+        if args.schema:
+            transformed_data = parquet_to_mip(args.parquet_file, args.output_file, args.rejected_file,
+                                              version=args.version, outcome_columns=args.outcome, **options)
+            export_to_json(transformed_data, args.schema)
+        else:
+            convert_parquet(args.parquet_file, args.output_file, profile_file=args.column_profile, **options)
+
+
+def profile_main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Profile the columns of a Parquet file without converting it")
+    parser.add_argument("parquet_file", help="The input Parquet file")
+    parser.add_argument("profile_file", help="The JSON file receiving the per-column statistics")
+    parser.add_argument("--column", action="append", dest="columns", metavar="COLUMN",
+                        help="Only profile this column (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows read at a time")
+    parser.add_argument("--workers", type=int, default=None, help="Number of threads profiling the columns")
+    parser.add_argument("--max-distinct", type=int, default=DEFAULT_MAX_DISTINCT,
+                        help="Distinct values tracked per column before its valueset is dropped")
+
+    args = parser.parse_args(argv)
+
+    write_profile(profile_parquet(args.parquet_file, args.columns, args.batch_size, args.workers, args.max_distinct),
+                  args.profile_file)
 
 
-# Example of how to call the function
 if __name__ == "__main__":
-    parquet_file = "../input_file.parquet"  # Replace with your input Parquet file
-    csv_file = "/home/kfilippopolitis/Desktop/mip-deployment/data/fhir/study1.csv"  # Replace with your desired output CSV file
-    columns_to_remove = ["Patient","Encounter","referenceTimePoint","eligibilityEventTime","eligibilityExitTime","nextReferenceTimePoint","previousReferenceTimePoint", 'lab_results_hba1c_value_stddev', 'lab_results_hba1c_value_min', 'lab_results_hba1c_value_avg', 'lab_results_hba1c_value_first', 'lab_results_hba1c_value_max', 'lab_results_hba1c_value_last'] + [
-    "encounters_primaryReasonCode",
-    "vital_signs_weight_value_stddev",
-    "vital_signs_height_value_stddev",
-    "vital_signs_systolicBp_value_last",
-    "vital_signs_systolicBp_value_max",
-    "vital_signs_systolicBp_value_avg",
-    "vital_signs_systolicBp_value_min",
-    "vital_signs_systolicBp_value_first",
-    "vital_signs_systolicBp_value_stddev",
-    "vital_signs_diastolicBp_value_last",
-    "vital_signs_diastolicBp_value_max",
-    "vital_signs_diastolicBp_value_avg",
-    "vital_signs_diastolicBp_value_min",
-    "vital_signs_diastolicBp_value_first",
-    "vital_signs_diastolicBp_value_stddev",
-    "vital_signs_heartRate_value_last",
-    "vital_signs_heartRate_value_max",
-    "vital_signs_heartRate_value_avg",
-    "vital_signs_heartRate_value_min",
-    "vital_signs_heartRate_value_first",
-    "vital_signs_heartRate_value_stddev",
-    "vital_signs_oxygenSaturation_value_last",
-    "vital_signs_oxygenSaturation_value_max",
-    "vital_signs_oxygenSaturation_value_avg",
-    "vital_signs_oxygenSaturation_value_min",
-    "vital_signs_oxygenSaturation_value_first",
-    "vital_signs_oxygenSaturation_value_stddev",
-    "lab_results_hemoglobin_value_stddev",
-    "lab_results_ferritin_value_stddev",
-    "lab_results_tfs_value_stddev",
-    "lab_results_ntProBnp_value_avg",
-    "lab_results_ntProBnp_value_last",
-    "lab_results_ntProBnp_value_min",
-    "lab_results_ntProBnp_value_stddev",
-    "lab_results_ntProBnp_value_first",
-    "lab_results_ntProBnp_value_max",
-    "lab_results_bnp_value_avg",
-    "lab_results_bnp_value_last",
-    "lab_results_bnp_value_min",
-    "lab_results_bnp_value_stddev",
-    "lab_results_bnp_value_first",
-    "lab_results_bnp_value_max",
-    "lab_results_crpHs_value_avg",
-    "lab_results_crpHs_value_last",
-    "lab_results_crpHs_value_min",
-    "lab_results_crpHs_value_stddev",
-    "lab_results_crpHs_value_first",
-    "lab_results_crpHs_value_max",
-    "lab_results_crpNonHs_value_avg",
-    "lab_results_crpNonHs_value_last",
-    "lab_results_crpNonHs_value_min",
-    "lab_results_crpNonHs_value_stddev",
-    "lab_results_crpNonHs_value_first",
-    "lab_results_crpNonHs_value_max",
-    "lab_results_tropIHs_value_avg",
-    "lab_results_tropIHs_value_last",
-    "lab_results_tropIHs_value_min",
-    "lab_results_tropIHs_value_stddev",
-    "lab_results_tropIHs_value_first",
-    "lab_results_tropIHs_value_max",
-    "lab_results_tropInHs_value_avg",
-    "lab_results_tropInHs_value_last",
-    "lab_results_tropInHs_value_min",
-    "lab_results_tropInHs_value_stddev",
-    "lab_results_tropInHs_value_first",
-    "lab_results_tropInHs_value_max",
-    "lab_results_tropTHs_value_stddev",
-    "lab_results_tropTnHs_value_stddev",
-    "lab_results_triGly_value_stddev",
-    "lab_results_cholTot_value_stddev",
-    "lab_results_hdl_value_stddev",
-    "lab_results_ldl_value_avg",
-    "lab_results_ldl_value_last",
-    "lab_results_ldl_value_min",
-    "lab_results_ldl_value_stddev",
-    "lab_results_ldl_value_first",
-    "lab_results_ldl_value_max",
-    "lab_results_potassium_value_stddev",
-    "lab_results_sodium_value_stddev",
-    "lab_results_creatBS_value_stddev",
-    "lab_results_creatUS_value_stddev",
-    "lab_results_albuminBS_value_stddev",
-    "lab_results_albuminUS_value_stddev",
-    "lab_results_eGFR_value_avg",
-    "lab_results_eGFR_value_last",
-    "lab_results_eGFR_value_min",
-    "lab_results_eGFR_value_stddev",
-    "lab_results_eGFR_value_first",
-    "lab_results_eGFR_value_max",
-    "lab_results_bun_value_stddev",
-    "lab_results_acr_value_stddev",
-    "lab_results_hba1c%_value_avg",
-    "lab_results_hba1c%_value_last",
-    "lab_results_hba1c%_value_min",
-    "lab_results_hba1c%_value_stddev",
-    "lab_results_hba1c%_value_first",
-    "lab_results_hba1c%_value_max",
-    "lab_results_hba1c_value_stddev",
-    "electrocardiographs_ecg_qrs_duration",
-    "electrocardiographs_ecg_qrs_axis",
-    "electrocardiographs_ecg_qt_duration_corrected",
-    "electrocardiographs_ecg_st",
-    "electrocardiographs_ecg_ischemia_without_st",
-    "electrocardiographs_ecg_type_of_rhythm",
-    "nyha_value",
-    "ckd_severity_categorizedValue"
-]
-    parquet_to_csv(parquet_file, csv_file, columns_to_remove)
+    main()
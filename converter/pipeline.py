@@ -0,0 +1,114 @@
+import queue
+import threading
+
+# Items buffered between two pipeline stages; memory in flight is bounded by these queues
+DEFAULT_QUEUE_SIZE = 2
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def background(iterable, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Iterate `iterable` in a background thread, running ahead of the consumer by at most `queue_size`
+    items (e.g. prefetching the next row group while the current one is transformed).
+    An exception raised while producing is re-raised in the consumer; closing the returned
+    generator early stops the producer thread.
+    """
+    items = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    break
+            else:
+                put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name="pipeline-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class BackgroundWriter:
+    """
+    Hand items to `write` in a background thread through a queue of at most `queue_size` items,
+    so that serialising and flushing one batch overlaps with preparing the next one.
+    A failure of `write` is raised by the next submit or by close.
+    """
+
+    def __init__(self, write, queue_size=DEFAULT_QUEUE_SIZE):
+        self._write = write
+        self._items = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._consume, name="pipeline-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Already failing: stop the writer without masking the original exception
+            self._items.put(_DONE)
+            self._thread.join()
+
+    def _consume(self):
+        while True:
+            item = self._items.get()
+            if item is _DONE:
+                return
+            if self._error is not None:
+                continue  # Keep draining so that submit never blocks on a dead writer
+            try:
+                self._write(item)
+            except BaseException as e:
+                self._error = e
+
+    def submit(self, item):
+        self._raise_error()
+        self._items.put(item)
+
+    def close(self):
+        """
+        Wait until every submitted item is written, re-raising a write failure.
+        """
+        self._items.put(_DONE)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,557 @@
+import os
+import json
+import time
+import asyncio
+import signal
+import hashlib
+import argparse
+import multiprocessing
+from http import HTTPStatus
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from contextlib import suppress
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from converter.fhir2mip import transform_entry, transform_feature, read_from_json, export_to_json, \
+    export_data_models, write_rejected_codes
+from converter.model import to_serialisable
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Encoded responses of repeated requests kept by the server
+DEFAULT_RESPONSE_CACHE_ENTRIES = 256
+# Parsed FHIR input files (and their transformed entries) kept by each worker, keyed by path,
+# modification time and size
+DEFAULT_PARSED_INPUT_ENTRIES = 8
+DEFAULT_MAX_BODY_BYTES = 512 * 1024 * 1024
+
+# Bodies up to this size are hashed on the event loop, larger ones in a thread
+INLINE_DIGEST_BYTES = 1024 * 1024
+
+# Latest latencies kept per route to compute the percentiles reported by /metrics
+LATENCY_WINDOW = 1024
+
+# Options of a /data request passed on to convert_parquet / parquet_to_mip
+DATA_OPTIONS = ("columns_to_remove", "dataset_name", "batch_size", "output_format", "pipeline", "dictionary")
+# Options of /schema and /data requests naming files, confined to the root directory of the server
+SCHEMA_PATH_OPTIONS = ("input_file", "output_file", "rejected_file")
+DATA_PATH_OPTIONS = ("parquet_file", "output_file", "schema_file", "rejected_file", "profile_file")
+
+# Host headers accepted whatever the listening address; anything else may be a DNS rebinding attempt
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+class LRUCache:
+    """
+    Mapping of at most `max_entries` items, evicting the least recently used one.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Per worker process state, set up by _init_worker and kept warm across requests
+_parsed_inputs = None
+_transformed_inputs = None
+
+
+def _init_worker(parsed_input_entries):
+    global _parsed_inputs, _transformed_inputs
+    _parsed_inputs = LRUCache(parsed_input_entries)
+    _transformed_inputs = LRUCache(parsed_input_entries)
+
+
+def _input_key(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def _load_input(key):
+    data = _parsed_inputs.get(key)
+    if data is None:
+        data = read_from_json(key[0])
+        _parsed_inputs.put(key, data)
+    return data
+
+
+def _transform_entries(entries, input_key=None):
+    """
+    transform_entry every entry. The results of an input file are kept like its parsed content, keyed by
+    its path, modification time and size: hashing every feature would cost more than transforming it.
+    """
+    if input_key is None:
+        return [transform_entry(dataset) for dataset in entries]
+    key = (*input_key, len(entries))
+    results = _transformed_inputs.get(key)
+    if results is None:
+        results = [transform_entry(dataset) for dataset in entries]
+        _transformed_inputs.put(key, results)
+    return results
+
+
+def _schema_job(request):
+    input_key = _input_key(request["input_file"]) if "input_file" in request else None
+    data = _load_input(input_key) if input_key else json.loads(request["body"])
+    entries = data["entries"]
+    if not entries:
+        raise ValueError("No entries found in the original data.")
+    if not request["all_entries"]:
+        entries = entries[:1]
+
+    results = _transform_entries(entries, input_key)
+    data_models = [data_model for data_model, _ in results]
+    rejected_codes = [code for _, entry_rejected in results for code in entry_rejected]
+
+    if request.get("rejected_file"):
+        write_rejected_codes(rejected_codes, request["rejected_file"])
+    if request.get("output_file"):
+        if request["all_entries"]:
+            export_data_models(data_models, request["output_file"], request["split"])
+        else:
+            export_to_json(data_models[0], request["output_file"])
+        return {"output_file": request["output_file"], "data_models": len(data_models), "rejected": rejected_codes}
+
+    if request["all_entries"]:
+        return {"data_models": data_models, "rejected": rejected_codes}
+    return {"data_model": data_models[0], "rejected": rejected_codes}
+
+
+def _feature_job(request):
+    features = json.loads(request["body"])
+    single = isinstance(features, dict)
+    results = []
+    for feature in [features] if single else features:
+        rejected_codes = []
+        variable = transform_feature(feature, rejected_codes)
+        results.append({"variable": variable, "rejected": bool(rejected_codes)})
+    return results[0] if single else results
+
+
+def _data_job(request):
+    # The Parquet path pulls in pyarrow/pandas, only import it once such a request comes in
+    from converter.parque2csv import convert_parquet, parquet_to_mip
+
+    options = request["options"]
+    parquet_file, output_file = options["parquet_file"], options["output_file"]
+    kwargs = {option: options[option] for option in DATA_OPTIONS if option in options}
+    if options.get("schema_file"):
+        rejected_file = options.get("rejected_file") or os.devnull
+        data_model = parquet_to_mip(parquet_file, output_file, rejected_file, version=options.get("version", "1.0"),
+                                    outcome_columns=options.get("outcome_columns"), **kwargs)
+        export_to_json(data_model, options["schema_file"])
+        return {"output_file": output_file, "schema_file": options["schema_file"]}
+    profile = convert_parquet(parquet_file, output_file, profile_file=options.get("profile_file"), **kwargs)
+    return {"output_file": output_file, "profile": profile}
+
+
+_JOBS = {"schema": _schema_job, "feature": _feature_job, "data": _data_job}
+
+
+def _to_serialisable(value):
+    # Profiles may hold dates or decimals, written as strings like write_profile does
+    return to_serialisable(value) if isinstance(value, Mapping) else str(value)
+
+
+def _run_job(job, request):
+    """
+    Run one job in a worker process. The response is encoded there too, so that only bytes travel
+    back; the hits and misses of the job on the transformed inputs are returned along with it.
+    """
+    hits, misses = _transformed_inputs.hits, _transformed_inputs.misses
+    body = json.dumps(_JOBS[job](request), default=_to_serialisable).encode("utf-8")
+    return body, _transformed_inputs.hits - hits, _transformed_inputs.misses - misses
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _RouteMetrics:
+    __slots__ = ("requests", "errors", "total_seconds", "latencies")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self, uptime):
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[int(q * (len(latencies) - 1))] * 1000, 3) if latencies else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput_rps": round(self.requests / uptime, 3) if uptime else None,
+            "latency_ms": {
+                "mean": round(self.total_seconds / self.requests * 1000, 3) if self.requests else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(latencies[-1] * 1000, 3) if latencies else None,
+            },
+        }
+
+
+class ServerMetrics:
+    """
+    Request counts, throughput and latency percentiles (over the latest LATENCY_WINDOW requests)
+    of every route, along with the hit rates of the response and transformed input caches.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.in_flight = 0
+        self.routes = {}
+        self.transform_cache_hits = 0
+        self.transform_cache_misses = 0
+
+    def record(self, route, status, seconds):
+        metrics = self.routes.get(route)
+        if metrics is None:
+            metrics = self.routes[route] = _RouteMetrics()
+        metrics.requests += 1
+        metrics.errors += status >= 400
+        metrics.total_seconds += seconds
+        metrics.latencies.append(seconds)
+
+    def snapshot(self, response_cache):
+        uptime = time.monotonic() - self.started
+        requests = sum(metrics.requests for metrics in self.routes.values())
+        return {
+            "uptime_seconds": round(uptime, 3),
+            "requests": requests,
+            "errors": sum(metrics.errors for metrics in self.routes.values()),
+            "in_flight": self.in_flight,
+            "throughput_rps": round(requests / uptime, 3) if uptime else None,
+            "routes": {route: metrics.snapshot(uptime) for route, metrics in sorted(self.routes.items())},
+            "response_cache": {"hits": response_cache.hits, "misses": response_cache.misses,
+                               "entries": len(response_cache)},
+            "transform_cache": {"hits": self.transform_cache_hits, "misses": self.transform_cache_misses},
+        }
+
+
+def _host_name(host):
+    try:
+        return urlsplit(f"//{host}").hostname
+    except ValueError:
+        return None
+
+
+def _flag(query, name):
+    return query.get(name, ["0"])[-1].lower() in ("1", "true", "yes")
+
+
+async def _digest(body):
+    if len(body) <= INLINE_DIGEST_BYTES:
+        return hashlib.sha256(body).hexdigest()
+    return await asyncio.to_thread(lambda: hashlib.sha256(body).hexdigest())
+
+
+class ConversionServer:
+    """
+    Long-running local conversion service over HTTP (TCP or Unix socket), so that repeated
+    conversions pay neither interpreter nor import startup. Requests are handled concurrently
+    with asyncio while the CPU-bound conversions run in a pool of worker processes, each keeping
+    the latest input files warm, parsed and transformed. Encoded responses of repeated side-effect
+    free requests are cached by the server itself.
+
+        GET  /health               liveness check
+        GET  /metrics              throughput, latency and cache statistics
+        POST /schema               body: a FHIR feature set, converted into its data model; or no body and
+                                   ?input_file=... (&output_file=...&rejected_file=...), read from disk.
+                                   &all_entries=1 converts every entry (&split=1 with output_file)
+        POST /feature              body: one raw feature (or a list of them), transformed into variables
+        POST /data                 body: {"parquet_file", "output_file", ...} options of convert_parquet,
+                                   with "schema_file" (and "rejected_file") running parquet_to_mip instead
+
+    Paths are read and written by the server process, so they must lie inside the `root` directory
+    (relative paths are resolved against it). Requests carrying an Origin header or a Host header
+    not naming the local machine are refused, and POST requests must be sent as application/json,
+    so that web pages open in a browser cannot drive the server.
+    """
+
+    def __init__(self, workers=None, root=".", parsed_input_entries=DEFAULT_PARSED_INPUT_ENTRIES,
+                 response_cache_entries=DEFAULT_RESPONSE_CACHE_ENTRIES, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+        # Spawned workers: forking a process that runs an event loop and threads is not safe
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker,
+                                             initargs=(parsed_input_entries,))
+        self._responses = LRUCache(response_cache_entries)
+        self._connections = set()
+        self._server = None
+        self._allowed_hosts = set(LOCAL_HOSTS)
+        self.root = os.path.realpath(root)
+        self.max_body_bytes = max_body_bytes
+        self.metrics = ServerMetrics()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        """
+        Start listening; returns the bound address (useful with port 0).
+        """
+        if unix_path:
+            self._server = await asyncio.start_unix_server(self._handle_connection, unix_path)
+        else:
+            if host not in ("", "0.0.0.0", "::"):
+                self._allowed_hosts.add(host.lower())
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._executor.shutdown()
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except RequestError as e:
+                    await self._respond(writer, e.status, self._error(e), keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, target, headers, body = request
+                status, payload = await self._dispatch(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away mid-request
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None  # Connection closed between two requests
+            raise
+        except asyncio.LimitOverrunError:
+            raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Malformed request line: {lines[0]!r}")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.max_body_bytes:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request body larger than {self.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        status = HTTPStatus(status)
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+    @staticmethod
+    def _error(error):
+        return json.dumps({"error": str(error)}).encode("utf-8")
+
+    def _check_client(self, method, headers):
+        """
+        Refuse the requests a browser could send on behalf of a web page: cross-origin ones, ones
+        addressed to another host name (DNS rebinding) and POSTs other than application/json.
+        """
+        if "origin" in headers:
+            raise RequestError(HTTPStatus.FORBIDDEN, "Cross-origin requests are not accepted")
+        if _host_name(headers.get("host", "")) not in self._allowed_hosts:
+            raise RequestError(HTTPStatus.FORBIDDEN, f"Host {headers.get('host')!r} is not served")
+        content_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        if method == "POST" and content_type != "application/json":
+            raise RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "POST requests must be sent as application/json")
+
+    def _confine(self, path):
+        """
+        Resolve a path of a request against the root directory, refusing the ones outside of it.
+        """
+        resolved = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, resolved]) != self.root:
+            raise RequestError(HTTPStatus.FORBIDDEN, f"{path} is outside of the served directory")
+        return resolved
+
+    async def _dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        route = url.path if url.path in self._routes else "other"
+        started = time.perf_counter()
+        self.metrics.in_flight += 1
+        try:
+            handler, expected_method = self._routes.get(url.path, (None, None))
+            if handler is None:
+                raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown path: {url.path}")
+            if method != expected_method:
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"{url.path} expects {expected_method}")
+            self._check_client(method, headers)
+            status, payload = HTTPStatus.OK, await handler(self, parse_qs(url.query), body)
+        except RequestError as e:
+            status, payload = e.status, self._error(e)
+        except FileNotFoundError as e:
+            status, payload = HTTPStatus.NOT_FOUND, self._error(e)
+        except (ValueError, KeyError, TypeError) as e:
+            # Malformed JSON, missing fields or invalid values
+            status, payload = HTTPStatus.BAD_REQUEST, self._error(e)
+        except Exception as e:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, self._error(e)
+        finally:
+            self.metrics.in_flight -= 1
+        self.metrics.record(route, status, time.perf_counter() - started)
+        return status, payload
+
+    async def _submit(self, job, request):
+        loop = asyncio.get_running_loop()
+        body, hits, misses = await loop.run_in_executor(self._executor, _run_job, job, request)
+        self.metrics.transform_cache_hits += hits
+        self.metrics.transform_cache_misses += misses
+        return body
+
+    async def _cached(self, key, job, request):
+        body = self._responses.get(key)
+        if body is None:
+            body = await self._submit(job, request)
+            self._responses.put(key, body)
+        return body
+
+    async def _health(self, query, body):
+        return b'{"status": "ok"}'
+
+    async def _metrics(self, query, body):
+        return json.dumps(self.metrics.snapshot(self._responses)).encode("utf-8")
+
+    async def _schema(self, query, body):
+        request = {"all_entries": _flag(query, "all_entries"), "split": _flag(query, "split")}
+        for option in SCHEMA_PATH_OPTIONS:
+            if option in query:
+                request[option] = self._confine(query[option][-1])
+
+        if "input_file" in request:
+            stat = os.stat(request["input_file"])
+            key = ("schema", request["all_entries"], request["input_file"],
+                   stat.st_mtime_ns, stat.st_size)
+        elif body:
+            request["body"] = body
+            key = ("schema", request["all_entries"], await _digest(body))
+        else:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Send a FHIR feature set as body or an input_file")
+
+        if "output_file" in request or "rejected_file" in request:
+            return await self._submit("schema", request)  # Writes files: always run
+        return await self._cached(key, "schema", request)
+
+    async def _feature(self, query, body):
+        return await self._cached(("feature", await _digest(body)), "feature", {"body": body})
+
+    async def _data(self, query, body):
+        options = json.loads(body)
+        if not isinstance(options, Mapping):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Send the options of the conversion as a JSON object")
+        for option in DATA_PATH_OPTIONS:
+            if options.get(option):
+                options[option] = self._confine(options[option])
+        return await self._submit("data", {"options": options})
+
+    # Path -> (handler, method)
+    _routes = {
+        "/health": (_health, "GET"),
+        "/metrics": (_metrics, "GET"),
+        "/schema": (_schema, "POST"),
+        "/feature": (_feature, "POST"),
+        "/data": (_data, "POST"),
+    }
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, **options):
+    """
+    Run a ConversionServer until interrupted (SIGINT/SIGTERM) or cancelled.
+    """
+    server = ConversionServer(**options)
+    address = await server.start(host, port, unix_path)
+    print(f"Serving on {address if unix_path else f'http://{address[0]}:{address[1]}'}", flush=True)
+    serving = asyncio.ensure_future(server.serve_forever())
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):  # No signal handlers in Windows event loops
+            loop.add_signal_handler(signum, serving.cancel)
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await server.close()
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Serve schema and data conversions over local HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument("--unix", metavar="SOCKET_PATH", help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--root", default=".",
+                        help="Directory holding every file read or written on behalf of a request "
+                             "(defaults to the working directory)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes (defaults to the CPU count)")
+    parser.add_argument("--parsed-input-entries", type=int, default=DEFAULT_PARSED_INPUT_ENTRIES,
+                        help="Parsed and transformed input files kept warm by each worker")
+    parser.add_argument("--response-cache-entries", type=int, default=DEFAULT_RESPONSE_CACHE_ENTRIES,
+                        help="Responses of repeated requests kept by the server")
+
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve(args.host, args.port, args.unix, workers=args.workers, root=args.root,
+                      parsed_input_entries=args.parsed_input_entries,
+                      response_cache_entries=args.response_cache_entries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import json
+import random
+
+# Default share of each FHIR dataType among generated features
+DEFAULT_TYPE_MIX = {"NUMERIC": 0.4, "NOMINAL": 0.4, "BOOLEAN": 0.2}
+
+
+def generate_feature(index, data_type, rng, valueset_size=20, rejected_ratio=0.05):
+    """
+    Generate one raw FHIR feature of the given dataType, with the statistics transform_feature reads.
+    """
+    num_of_not_null = 0 if rng.random() < rejected_ratio else rng.randint(1, 100_000)
+    feature = {
+        "name": f"Feature {index}-{data_type.lower()}",
+        "description": f"Synthetic {data_type.lower()} feature number {index}",
+        "dataType": data_type,
+        "generatedDescription": [f"Generated feature {index}"],
+        "statistics": {"numOfNotNull": num_of_not_null},
+    }
+    if data_type == "NUMERIC":
+        low = round(rng.uniform(-1000, 1000), 3)
+        # Some numeric features have a single value, whose min/max are dropped by transform_feature
+        feature["statistics"]["min"] = low
+        feature["statistics"]["max"] = low if rng.random() < 0.1 else round(low + rng.uniform(0, 1000), 3)
+    elif data_type == "NOMINAL":
+        feature["statistics"]["valueset"] = [f"code_{index}_{value}" for value in range(valueset_size)]
+    return feature
+
+
+def generate_feature_set(num_features=1000, num_outcomes=10, valueset_size=20, type_mix=None,
+                         rejected_ratio=0.05, num_entries=1, seed=0):
+    """
+    Generate a FHIR feature-set bundle with `num_entries` entries of `num_features` features and
+    `num_outcomes` outcomes each, drawing dataTypes from `type_mix` (weights per dataType).
+    """
+    rng = random.Random(seed)
+    type_mix = type_mix or DEFAULT_TYPE_MIX
+    data_types, weights = list(type_mix), list(type_mix.values())
+
+    def features(count, offset):
+        return [generate_feature(offset + index, rng.choices(data_types, weights)[0], rng, valueset_size,
+                                 rejected_ratio) for index in range(count)]
+
+    return {
+        "entries": [
+            {
+                "name": f"SyntheticDataset{entry}",
+                "meta": {"versionId": "1.0"},
+                "featureSet": {
+                    "features": features(num_features, 0),
+                    "outcomes": features(num_outcomes, num_features),
+                },
+            } for entry in range(num_entries)
+        ]
+    }
+
+
+def write_feature_set(path, **kwargs):
+    """
+    Generate a feature set (see generate_feature_set) and write it to a JSON file.
+    """
+    with open(path, 'w') as json_file:
+        json.dump(generate_feature_set(**kwargs), json_file)
+
+
+def write_cohort(path, num_rows=100_000, num_numeric=50, num_nominal=50, num_boolean=20, num_dropped=20,
+                 vocabulary_size=10, null_ratio=0.1, row_group_size=50_000, seed=0):
+    """
+    Write a wide synthetic Parquet cohort, one row group at a time. Besides a 'Patient' id column it has
+    numeric, nominal (codes drawn from a small vocabulary) and boolean columns, plus `num_dropped`
+    '*_stddev' columns meant to be removed by the conversion.
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"code_{value}" for value in range(vocabulary_size)], dtype=object)
+
+    def nulls(size):
+        return rng.random(size) < null_ratio
+
+    writer = None
+    try:
+        for start in range(0, num_rows, row_group_size):
+            size = min(row_group_size, num_rows - start)
+            columns = {"Patient": pa.array([f"patient_{row}" for row in range(start, start + size)])}
+            for index in range(num_numeric):
+                columns[f"Numeric Value-{index}"] = pa.array(rng.normal(100, 25, size), mask=nulls(size))
+            for index in range(num_nominal):
+                columns[f"Nominal Code-{index}"] = pa.array(vocabulary[rng.integers(0, vocabulary_size, size)],
+                                                            type=pa.string(), mask=nulls(size))
+            for index in range(num_boolean):
+                columns[f"Boolean Flag-{index}"] = pa.array(rng.random(size) < 0.5, mask=nulls(size))
+            for index in range(num_dropped):
+                columns[f"lab_results_{index}_value_stddev"] = pa.array(rng.random(size))
+
+            table = pa.table(columns)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
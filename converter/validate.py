@@ -0,0 +1,210 @@
+import csv
+import sys
+import json
+import argparse
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from converter.compression import open_input, detect_compression
+from converter.fhir2mip import normalise_code, read_from_json
+
+# Bytes of CSV (or rows of Parquet) validated at a time
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+# Distinct offending values reported per variable
+MAX_EXAMPLES = 5
+
+_NUMBER = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+
+
+def index_variables(data_model):
+    """
+    Hash index of every variable of a data model (top-level and in all, possibly nested, groups) by code.
+    """
+    index = {variable["code"]: variable for variable in data_model.get("variables", [])}
+    groups = list(data_model.get("groups", []))
+    while groups:
+        group = groups.pop()
+        index.update((variable["code"], variable) for variable in group.get("variables", []))
+        groups.extend(group.get("groups", []))
+    return index
+
+
+def dataset_variable(data_model):
+    """
+    Variable of the exported 'dataset' column. fhir2mip codes it after the dataset name (e.g. 'study1')
+    rather than 'dataset', as the only top-level variable of the data model.
+    """
+    variables = data_model.get("variables", [])
+    return variables[0] if len(variables) == 1 else None
+
+
+def _as_strings(array):
+    """
+    Enumeration codes are strings; booleans are spelled like the exported 'True'/'False'.
+    """
+    if pa.types.is_boolean(array.type):
+        return pc.if_else(array, "True", "False")
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        return array
+    return pc.cast(array, pa.string())
+
+
+def _as_numbers(array):
+    """
+    Cast a column to float64, returning it along with the mask of non-null values that are not numbers.
+    """
+    if pa.types.is_integer(array.type) or pa.types.is_floating(array.type) or pa.types.is_decimal(array.type):
+        return pc.cast(array, pa.float64()), None
+    strings = _as_strings(array)
+    valid = pc.match_substring_regex(strings, _NUMBER)
+    numbers = pc.cast(pc.if_else(valid, strings, pa.scalar(None, pa.string())), pa.float64())
+    return numbers, pc.invert(valid)
+
+
+class VariableChecker:
+    """
+    Vectorised checks of one data column against its schema variable: numeric range for
+    variables with minValue/maxValue, membership of the enumeration codes for categorical ones.
+    """
+
+    def __init__(self, variable):
+        self.code = variable["code"]
+        self.is_numeric = variable.get("type") in ("real", "integer")
+        self.min_value = variable.get("minValue")
+        self.max_value = variable.get("maxValue")
+        codes = [enumeration["code"] for enumeration in variable.get("enumerations", [])]
+        self.enumerations = pa.array([str(code) for code in codes], pa.string()) \
+            if variable.get("isCategorical") and codes else None
+        self.counts = {"invalid_numeric": 0, "out_of_range": 0, "not_in_enumerations": 0}
+        self.examples = []
+
+    def check(self, array):
+        if self.is_numeric:
+            numbers, invalid = _as_numbers(array)
+            if invalid is not None:
+                self._count("invalid_numeric", invalid, array)
+            out_of_range = None
+            if self.min_value is not None:
+                out_of_range = pc.less(numbers, self.min_value)
+            if self.max_value is not None:
+                above = pc.greater(numbers, self.max_value)
+                out_of_range = above if out_of_range is None else pc.or_(out_of_range, above)
+            if out_of_range is not None:
+                self._count("out_of_range", out_of_range, array)
+        if self.enumerations is not None:
+            strings = _as_strings(array)
+            self._count("not_in_enumerations", pc.invert(pc.is_in(strings, value_set=self.enumerations)), strings)
+
+    def _count(self, kind, mask, array):
+        # Nulls are never violations: only count the positions where the mask is true
+        mask = pc.and_kleene(mask, pc.is_valid(array))
+        count = pc.sum(mask).as_py() or 0
+        if not count:
+            return
+        self.counts[kind] += count
+        if len(self.examples) < MAX_EXAMPLES:
+            for value in pc.unique(array.filter(mask)).to_pylist():
+                if value not in self.examples and len(self.examples) < MAX_EXAMPLES:
+                    self.examples.append(value)
+
+    def result(self):
+        violations = {kind: count for kind, count in self.counts.items() if count}
+        if violations:
+            violations["examples"] = self.examples
+        return violations
+
+
+def _csv_batches(data_file, block_size):
+    # gzip and zstd compressed CSV is decompressed by Arrow while streaming
+    with open_input(data_file, newline='') as f:
+        header = next(csv.reader(f), [])
+    convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in header},
+                                            strings_can_be_null=True)
+    reader = pa_csv.open_csv(pa.input_stream(data_file, compression=detect_compression(data_file)),
+                             read_options=pa_csv.ReadOptions(block_size=block_size),
+                             convert_options=convert_options)
+    return header, reader
+
+
+def _parquet_batches(data_file, batch_size):
+    parquet = pq.ParquetFile(data_file)
+    return parquet.schema_arrow.names, parquet.iter_batches(batch_size=batch_size)
+
+
+def validate_data(data_model, data_file, block_size=DEFAULT_BLOCK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Check that a CSV (possibly gzip or zstd compressed, or Parquet) data file conforms to a data model,
+    streaming it in batches.
+    Headers are mapped to variable codes through a hash index of the schema, and the 'dataset' column
+    to the dataset variable; numeric ranges and enumeration membership are checked with vectorised
+    Arrow kernels. Returns a violation summary.
+    """
+    index = index_variables(data_model)
+    dataset = dataset_variable(data_model)
+    if str(data_file).endswith(".parquet"):
+        header, batches = _parquet_batches(data_file, batch_size)
+    else:
+        header, batches = _csv_batches(data_file, block_size)
+
+    checkers = {}
+    unnormalised_columns = {}
+    unknown_columns = []
+    for column in header:
+        code = column if column in index else normalise_code(column)
+        if code not in index and column == "dataset" and dataset is not None:
+            checkers[column] = VariableChecker(dataset)
+            continue
+        if code not in index:
+            unknown_columns.append(column)
+            continue
+        if code != column:
+            unnormalised_columns[column] = code
+        checkers[column] = VariableChecker(index[code])
+    matched_codes = {checker.code for checker in checkers.values()}
+
+    rows = 0
+    for batch in batches:
+        rows += batch.num_rows
+        for column, checker in checkers.items():
+            checker.check(batch.column(column))
+
+    violations = {checker.code: checker.result() for checker in checkers.values() if checker.result()}
+    violation_count = sum(count for result in violations.values()
+                          for kind, count in result.items() if kind != "examples")
+    missing_columns = sorted(set(index) - matched_codes)
+    return {
+        "rows": rows,
+        "unknown_columns": unknown_columns,
+        "missing_columns": missing_columns,
+        "unnormalised_columns": unnormalised_columns,
+        "violations": violations,
+        "violation_count": violation_count,
+        "valid": not (violation_count or unknown_columns or missing_columns or unnormalised_columns),
+    }
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Check that exported data conforms to a MIP data model")
+    parser.add_argument("data_model", help="The data model JSON file produced by fhir2mip")
+    parser.add_argument("data_file", help="The CSV (or Parquet) data file to validate")
+    parser.add_argument("--report", help="Write the violation summary to this JSON file")
+
+    args = parser.parse_args(argv)
+
+    summary = validate_data(read_from_json(args.data_model), args.data_file)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(summary, f, indent=4, default=str)
+    print(f"{summary['rows']} rows, {summary['violation_count']} violations, "
+          f"{len(summary['unknown_columns'])} unknown and {len(summary['missing_columns'])} missing columns")
+    if not summary["valid"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
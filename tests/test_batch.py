@@ -0,0 +1,78 @@
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from converter.batch import convert_batch, read_manifest, collect_input_files, output_paths
+
+
+class TestBatchConversion(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp_dir.name, "inputs")
+        self.output_dir = os.path.join(self.tmp_dir.name, "outputs")
+        os.makedirs(os.path.join(self.input_dir, "site"))
+        minimal_fhir = os.path.join(os.path.dirname(__file__), "..", "data", "minimal_fhir.json")
+        for name in ("a.json", "b.json", os.path.join("site", "c.json")):
+            shutil.copy(minimal_fhir, os.path.join(self.input_dir, name))
+        with open(os.path.join(self.input_dir, "broken.json"), 'w') as f:
+            f.write('{"entries": []}')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_collect_input_files(self):
+        self.assertEqual([os.path.basename(path) for path in collect_input_files([self.input_dir])],
+                         ["a.json", "b.json", "broken.json"])
+        self.assertEqual(len(collect_input_files([self.input_dir], recursive=True)), 4)
+        self.assertEqual(len(collect_input_files([os.path.join(self.input_dir, "*", "*.json")])), 1)
+
+    def test_compressed_inputs(self):
+        with open(os.path.join(self.input_dir, "a.json"), 'rb') as f_in, \
+                gzip.open(os.path.join(self.input_dir, "d.json.gz"), 'wb') as f_out:
+            f_out.write(f_in.read())
+        self.assertIn("d.json.gz", [os.path.basename(path) for path in collect_input_files([self.input_dir])])
+        output_file, rejected_file = output_paths(os.path.join(self.input_dir, "d.json.gz"), self.output_dir)
+        self.assertEqual(os.path.basename(output_file), "d.json")
+        self.assertEqual(os.path.basename(rejected_file), "d.rejected.txt")
+
+    def test_failures_are_isolated_and_recorded(self):
+        records = convert_batch([self.input_dir], self.output_dir, workers=2)
+        statuses = {os.path.basename(record["input"]): record["status"] for record in records}
+        self.assertEqual(statuses, {"a.json": "ok", "b.json": "ok", "broken.json": "error"})
+
+        with open(os.path.join(self.output_dir, "a.json")) as f:
+            self.assertEqual(json.load(f)["code"], "SampleDataset")
+        manifest = read_manifest(os.path.join(self.output_dir, "manifest.jsonl"))
+        record = manifest[os.path.join(self.input_dir, "a.json")]
+        self.assertEqual(record["rejected_count"], 1)
+        self.assertEqual(len(record["input_hash"]), 64)
+        self.assertIn("ValueError", manifest[os.path.join(self.input_dir, "broken.json")]["error"])
+
+    def test_resume_skips_files_already_done(self):
+        convert_batch([self.input_dir], self.output_dir, workers=2)
+
+        # Only the failed file and the modified one are converted again
+        with open(os.path.join(self.input_dir, "b.json")) as f:
+            data = json.load(f)
+        data["entries"][0]["name"] = "Changed"
+        with open(os.path.join(self.input_dir, "b.json"), 'w') as f:
+            json.dump(data, f)
+
+        records = convert_batch([self.input_dir], self.output_dir, workers=2)
+        self.assertEqual(sorted(os.path.basename(record["input"]) for record in records), ["b.json", "broken.json"])
+
+        records = convert_batch([self.input_dir], self.output_dir, workers=2, resume=False)
+        self.assertEqual(len(records), 3)
+
+    def test_duplicate_output_names(self):
+        shutil.copy(os.path.join(self.input_dir, "a.json"), os.path.join(self.input_dir, "site", "a.json"))
+        with self.assertRaises(ValueError):
+            convert_batch([self.input_dir], self.output_dir, recursive=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
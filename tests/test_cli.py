@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+from converter.cli import COMMANDS, load_command, main
+from converter.synthetic import write_cohort
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MINIMAL_FHIR = os.path.join(ROOT, "data", "minimal_fhir.json")
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_every_command_loads(self):
+        for command in COMMANDS:
+            self.assertTrue(callable(load_command(command)), command)
+
+    def test_schema_does_not_import_data_libraries(self):
+        script = ("import sys; from converter.cli import main; main(sys.argv[1:]); "
+                  "print(sorted(m for m in ('pandas', 'pyarrow', 'multiprocessing') if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", script, "schema", MINIMAL_FHIR, self.path("out.json"),
+                                 self.path("rejected.txt")], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]")
+        self.assertTrue(os.path.exists(self.path("out.json")))
+
+    def test_data_with_schema(self):
+        parquet_file = self.path("cohort.parquet")
+        write_cohort(parquet_file, num_rows=100, num_numeric=2, num_nominal=1, num_boolean=1, num_dropped=1, seed=1)
+        main(["data", parquet_file, self.path("cohort.csv"), "--drop", "Patient", "--drop", "*_stddev", "--dataset", "site_a",
+              "--schema", self.path("schema.json"), "--rejected-file", self.path("rejected.txt")])
+        with open(self.path("schema.json")) as f:
+            schema = json.load(f)
+        self.assertEqual(schema["code"], "site_a")
+        with open(self.path("cohort.csv")) as f:
+            header = f.readline().strip().split(",")
+        self.assertNotIn("Patient", header)
+        self.assertFalse(any(column.endswith("_stddev") for column in header))
+        self.assertIn("dataset", header)
+
+    def test_unknown_command(self):
+        with self.assertRaises(SystemExit):
+            main(["unknown"])
+
+
+if __name__ == '__main__':
+    unittest.main()
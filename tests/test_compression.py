@@ -0,0 +1,68 @@
+import os
+import gzip
+import tempfile
+import unittest
+
+from converter.compression import ParallelCompressedWriter, open_output, open_input, detect_compression, \
+    compression_of, strip_compression_extension
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.text = "".join(f"row {index},value {index * 7 % 13}\n" for index in range(20_000))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_round_trip(self):
+        for name in ("data.csv.gz", "data.csv.zst", "data.csv"):
+            with open_output(self.path(name), newline='') as f:
+                for start in range(0, len(self.text), 1000):
+                    f.write(self.text[start:start + 1000])
+            with open_input(self.path(name), newline='') as f:
+                self.assertEqual(f.read(), self.text, name)
+        self.assertLess(os.path.getsize(self.path("data.csv.gz")), len(self.text) / 4)
+
+    def test_blocks_are_written_in_order(self):
+        data = self.text.encode("utf-8")
+        for compression in ("gzip", "zstd"):
+            path = self.path(f"blocks.{compression}")
+            with ParallelCompressedWriter(open(path, 'wb'), compression, workers=4, block_size=1000) as f:
+                for start in range(0, len(data), 777):
+                    f.write(data[start:start + 777])
+            with open_input(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        # Independent gzip members still form one standard gzip stream
+        with gzip.open(self.path("blocks.gzip"), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_empty_output_is_valid(self):
+        for name in ("empty.json.gz", "empty.json.zst"):
+            with open_output(self.path(name)):
+                pass
+            with open_input(self.path(name)) as f:
+                self.assertEqual(f.read(), "")
+
+    def test_compression_is_detected_from_content(self):
+        with open_output(self.path("misnamed.json"), compression="gzip") as f:
+            f.write(self.text)
+        self.assertEqual(detect_compression(self.path("misnamed.json")), "gzip")
+        with open_input(self.path("misnamed.json")) as f:
+            self.assertEqual(f.read(), self.text)
+
+    def test_extensions(self):
+        self.assertEqual(compression_of("out.JSON.GZ"), "gzip")
+        self.assertEqual(compression_of("out.csv.zst"), "zstd")
+        self.assertIsNone(compression_of("out.csv"))
+        self.assertEqual(strip_compression_extension("cohort.csv.gz"), "cohort.csv")
+        with self.assertRaises(ValueError):
+            open_output(self.path("out.bz2"), compression="bzip2")
+
+
+if __name__ == '__main__':
+    unittest.main()
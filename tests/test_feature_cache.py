@@ -0,0 +1,70 @@
+import os
+import copy
+import json
+import tempfile
+import unittest
+
+from converter.feature_cache import diff_data_models
+from converter.fhir2mip import transform_data, main
+
+
+class TestFeatureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rejected_file = os.path.join(self.tmp_dir.name, "rejected.txt")
+        self.input_data = {
+            "entries": [{
+                "name": "SampleDataset",
+                "meta": {"versionId": "1.0"},
+                "featureSet": {
+                    "features": [
+                        {"name": "Age", "description": "Patient's age", "dataType": "NUMERIC", "statistics": {"min": 0, "max": 100, "numOfNotNull": 100}},
+                        {"name": "IsSmoker", "description": "Patient's smoking status", "dataType": "BOOLEAN", "statistics": {"numOfNotNull": 0}},
+                        {"name": "Gender", "description": "Patient's gender", "dataType": "NOMINAL", "statistics": {"valueset": ["Male", "Female"], "numOfNotNull": 100}}
+                    ],
+                    "outcomes": [
+                        {"name": "HeartDisease", "description": "Whether patient has heart disease", "dataType": "BOOLEAN", "statistics": {"numOfNotNull": 50}}
+                    ]
+                }
+            }]
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_incremental_rerun_only_rewrites_changed_output(self):
+        input_file = os.path.join(self.tmp_dir.name, "input.json")
+        output_file = os.path.join(self.tmp_dir.name, "output.json")
+        diff_file = os.path.join(self.tmp_dir.name, "diff.json")
+        with open(input_file, 'w') as f:
+            json.dump(self.input_data, f)
+        main([input_file, output_file, self.rejected_file, "--incremental"])
+        os.utime(output_file, (0, 0))
+
+        # Unchanged input: the output is left untouched
+        main([input_file, output_file, self.rejected_file, "--diff", diff_file])
+        self.assertEqual(os.stat(output_file).st_mtime, 0)
+        with open(diff_file) as f:
+            self.assertEqual(json.load(f), {"added": [], "removed": [], "changed": []})
+
+        changed_input = copy.deepcopy(self.input_data)
+        changed_input["entries"][0]["featureSet"]["features"][0]["statistics"]["max"] = 120
+        with open(input_file, 'w') as f:
+            json.dump(changed_input, f)
+        main([input_file, output_file, self.rejected_file, "--diff", diff_file, "--stream"])
+        self.assertNotEqual(os.stat(output_file).st_mtime, 0)
+        with open(diff_file) as f:
+            self.assertEqual(json.load(f), {"added": [], "removed": [], "changed": ["age"]})
+        with open(output_file) as f:
+            self.assertEqual(json.load(f), transform_data(changed_input, self.rejected_file))
+
+    def test_diff_data_models(self):
+        old = {"variables": [{"code": "dataset"}], "groups": [{"variables": [{"code": "age", "minValue": 0}, {"code": "bmi"}]}]}
+        new = {"variables": [{"code": "dataset"}], "groups": [{"variables": [{"code": "age", "minValue": 1}, {"code": "sex"}]}]}
+        self.assertEqual(diff_data_models(old, new), {"added": ["sex"], "removed": ["bmi"], "changed": ["age"]})
+        self.assertEqual(diff_data_models(None, new)["added"], ["age", "dataset", "sex"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,14 @@
+import io
+import os
+import gzip
+import json
+import tempfile
 import unittest
 
-from converter.fhir2mip import transform_data, export_to_json
+from converter.fhir2mip import (
+    transform_data, export_to_json, stream_transform_data, iter_feature_stream,
+    transform_all_entries, export_data_models, DataModelWriter, orjson, read_from_json, _JSONStream
+)
 
 
 class TestFHIRToMIPTransform(unittest.TestCase):
@@ -160,5 +168,235 @@ class TestFHIRToMIPTransform(unittest.TestCase):
             transform_data(input_data, rejected_file_path)
 
 
+class TestStreamingTransform(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_data = {
+            "resourceType": "Bundle",
+            "entries": [
+                {
+                    "featureSet": {
+                        "features": [
+                            {"name": "Age", "description": "Patient's age", "dataType": "NUMERIC", "statistics": {"min": 0.5, "max": 100, "numOfNotNull": 100}},
+                            {"name": "IsSmoker", "description": "Patient's smoking status", "dataType": "BOOLEAN", "statistics": {"numOfNotNull": 0}},
+                            {"name": "Gender", "description": "Patient's \"gender\" {m/f}", "dataType": "NOMINAL", "statistics": {"valueset": ["Male", "Female"], "numOfNotNull": 100}}
+                        ],
+                        "extensions": [{"ignored": True}],
+                        "outcomes": [
+                            {"name": "HeartDisease", "description": "Whether patient has heart disease", "dataType": "BOOLEAN", "statistics": {"numOfNotNull": 50}}
+                        ]
+                    },
+                    # Entry metadata placed after the feature set on purpose
+                    "name": "SampleDataset",
+                    "meta": {"versionId": "1.0"}
+                },
+                {
+                    "name": "SecondDataset",
+                    "meta": {"versionId": "2.0"},
+                    "featureSet": {"features": [{"name": "Weight", "description": "Weight", "dataType": "NUMERIC", "statistics": {"min": 1, "max": 2}}]}
+                }
+            ]
+        }
+        self.input_file = os.path.join(self.tmp_dir.name, "input.json")
+        with open(self.input_file, 'w') as f:
+            json.dump(self.input_data, f, indent=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_matches_in_memory_transformation(self):
+        expected_rejected = os.path.join(self.tmp_dir.name, "expected_rejected.txt")
+        streamed_rejected = os.path.join(self.tmp_dir.name, "streamed_rejected.txt")
+        expected = transform_data(self.input_data, expected_rejected)
+
+        # Tiny chunks force values, keys and numbers to be split across buffer refills
+        for chunk_size in (1, 7, 64 * 1024):
+            self.assertEqual(stream_transform_data(self.input_file, streamed_rejected, chunk_size=chunk_size), expected)
+            with open(expected_rejected) as f1, open(streamed_rejected) as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    def test_floats_cut_by_chunk_boundaries(self):
+        # Numbers outside feature objects are decoded on their own, so a chunk may end right after '12.' or '0.8'
+        input_data = dict(self.input_data, score=12.75, ratios=[1.5, 2e-3, 1.25E+2, -0.5])
+        input_data["entries"] = [dict(self.input_data["entries"][0], completeness=0.875)]
+        with open(self.input_file, 'w') as f:
+            json.dump(input_data, f)
+        rejected_file = os.path.join(self.tmp_dir.name, "rejected.txt")
+        expected = transform_data(input_data, rejected_file)
+        for chunk_size in range(1, 41):
+            self.assertEqual(stream_transform_data(self.input_file, rejected_file, chunk_size=chunk_size), expected)
+
+        numbers = [12.75, 0.875, 1e-07, 3.5e+20, 42, -1.0]
+        for chunk_size in range(1, 41):
+            stream = _JSONStream(io.StringIO(json.dumps(numbers)), chunk_size)
+            values = []
+            for _ in stream.iter_array():
+                values.append(stream.value())
+            self.assertEqual(values, numbers)
+
+    def test_iter_feature_stream_yields_every_entry(self):
+        events = [(index, group) for index, group, _ in iter_feature_stream(self.input_file, chunk_size=5)]
+        self.assertEqual(events, [
+            (0, "features"), (0, "features"), (0, "features"), (0, "outcomes"), (0, "entry"),
+            (1, "features"), (1, "entry"),
+        ])
+
+    def test_compressed_input_and_output(self):
+        rejected_file = os.path.join(self.tmp_dir.name, "rejected.txt")
+        expected = transform_data(self.input_data, rejected_file)
+        # Compressed inputs are recognised from their content, not their name
+        compressed_input = os.path.join(self.tmp_dir.name, "input.json")
+        with open(self.input_file, 'rb') as f_in, gzip.open(compressed_input + ".gz", 'wb') as f_out:
+            f_out.write(f_in.read())
+        os.replace(compressed_input + ".gz", compressed_input)
+        self.assertEqual(stream_transform_data(compressed_input, rejected_file, chunk_size=7), expected)
+        self.assertEqual(read_from_json(compressed_input), self.input_data)
+
+        for compression, extension in (("gzip", ".gz"), ("zstd", ".zst")):
+            output_file = os.path.join(self.tmp_dir.name, "output.json" + extension)
+            export_to_json(expected, output_file)
+            self.assertEqual(read_from_json(output_file), expected)
+            plain_named_file = os.path.join(self.tmp_dir.name, "output.json")
+            export_to_json(expected, plain_named_file, compression=compression)
+            self.assertEqual(read_from_json(plain_named_file), expected)
+
+    def test_stream_all_entries(self):
+        rejected_file = os.path.join(self.tmp_dir.name, "rejected.txt")
+        data_models = stream_transform_data(self.input_file, rejected_file, chunk_size=3, all_entries=True)
+        self.assertEqual(data_models, transform_all_entries(self.input_data, rejected_file, workers=1))
+
+    def test_empty_entries(self):
+        with open(self.input_file, 'w') as f:
+            json.dump({"entries": []}, f)
+        with self.assertRaises(ValueError):
+            stream_transform_data(self.input_file, os.path.join(self.tmp_dir.name, "rejected.txt"))
+
+    def test_truncated_file(self):
+        with open(self.input_file, 'w') as f:
+            f.write('{"entries": [{"featureSet": {"features": [{"name": "Age"')
+        with self.assertRaises(ValueError):
+            stream_transform_data(self.input_file, os.path.join(self.tmp_dir.name, "rejected.txt"), chunk_size=4)
+
+
+class TestAllEntriesTransform(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rejected_file = os.path.join(self.tmp_dir.name, "rejected.txt")
+        self.input_data = {"entries": [
+            {
+                "name": f"Dataset{index}",
+                "meta": {"versionId": "1.0"},
+                "featureSet": {
+                    "features": [
+                        {"name": "Age", "description": "Patient's age", "dataType": "NUMERIC", "statistics": {"min": 0, "max": index + 1, "numOfNotNull": 10}},
+                        {"name": f"Empty{index}", "description": "Never filled", "dataType": "NOMINAL", "statistics": {"numOfNotNull": 0}}
+                    ]
+                }
+            } for index in range(5)
+        ]}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_every_entry_is_transformed_in_order(self):
+        data_models = transform_all_entries(self.input_data, self.rejected_file, workers=1)
+        self.assertEqual([data_model["code"] for data_model in data_models], [f"Dataset{index}" for index in range(5)])
+        self.assertEqual(data_models[0], transform_data(self.input_data, os.path.join(self.tmp_dir.name, "first.txt")))
+        with open(self.rejected_file) as f:
+            self.assertEqual(f.read().splitlines(), [f"Empty{index}" for index in range(5)])
+
+    def test_process_pool_matches_sequential(self):
+        sequential = transform_all_entries(self.input_data, self.rejected_file, workers=1)
+        self.assertEqual(transform_all_entries(self.input_data, self.rejected_file, workers=2), sequential)
+
+    def test_empty_input(self):
+        with self.assertRaises(ValueError):
+            transform_all_entries({"entries": []}, self.rejected_file)
+
+    def test_export_split(self):
+        data_models = transform_all_entries(self.input_data, self.rejected_file, workers=1)
+        output_dir = os.path.join(self.tmp_dir.name, "models")
+        export_data_models(data_models, output_dir, split=True)
+        self.assertEqual(sorted(os.listdir(output_dir)), [f"Dataset{index}.json" for index in range(5)])
+        with open(os.path.join(output_dir, "Dataset3.json")) as f:
+            self.assertEqual(json.load(f), data_models[3])
+
+    def test_export_split_rejects_duplicate_codes(self):
+        data_models = transform_all_entries(self.input_data, self.rejected_file, workers=1)
+        with self.assertRaises(ValueError):
+            export_data_models([data_models[0], data_models[0]], os.path.join(self.tmp_dir.name, "models"), split=True)
+
+    def test_export_split_rejects_unsafe_codes(self):
+        data_models = transform_all_entries(self.input_data, self.rejected_file, workers=1)
+        output_dir = os.path.join(self.tmp_dir.name, "models")
+        for code in ("../escaped", "..", ""):
+            with self.assertRaises(ValueError):
+                export_data_models([dict(data_models[0], code=code)], output_dir, split=True)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, "escaped.json")))
+
+
+class TestDataModelWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.data_model = {
+            "code": "SampleDataset",
+            "version": "1.0",
+            "longitudinal": False,
+            "variables": [{"code": "sampledataset", "enumerations": [{"code": "sampledataset", "label": "SampleDataset"}]}],
+            "groups": [
+                {"code": "features", "label": "Features", "variables": [
+                    {"code": "age", "minValue": 0.5, "maxValue": 100, "enumerations": []},
+                    {"code": "gender", "label": "Patient's \"gender\"\n(m/f)", "enumerations": [{"code": "F", "label": "F"}]},
+                ], "groups": [{"code": "nested", "label": "Nested", "variables": []}]},
+                {"code": "outcomes", "label": "Outcomes", "variables": []},
+            ],
+        }
+        self.backends = [False] + ([True] if orjson is not None else [])
+
+    def write(self, value, compact, fast):
+        output = io.StringIO()
+        DataModelWriter(output, compact, fast).write(value)
+        return output.getvalue()
+
+    def test_indented_layout_matches_json_dump(self):
+        for fast in self.backends:
+            self.assertEqual(self.write(self.data_model, False, fast), json.dumps(self.data_model, indent=4))
+            self.assertEqual(self.write([self.data_model] * 2, False, fast), json.dumps([self.data_model] * 2, indent=4))
+
+    def test_fast_backend_writes_the_same_values(self):
+        if orjson is None:
+            self.skipTest("orjson is not installed")
+        data_model = dict(self.data_model, label="Étude \u00b5", nested=[[[[{"a": [1, {"b": []}]}]]]], big=1e16)
+        indented = self.write(data_model, False, True)
+        self.assertEqual(json.loads(indented), data_model)
+        # Only the spelling of non-ASCII characters and floats differs from json.dumps
+        self.assertEqual(json.dumps(json.loads(indented), indent=4), json.dumps(data_model, indent=4))
+        self.assertEqual([len(line) - len(line.lstrip(" ")) for line in indented.splitlines()],
+                         [len(line) - len(line.lstrip(" ")) for line in json.dumps(data_model, indent=4).splitlines()])
+
+    def test_compact(self):
+        for fast in self.backends:
+            self.assertEqual(self.write(self.data_model, True, fast), json.dumps(self.data_model, separators=(",", ":")))
+
+    def test_variables_may_be_generators(self):
+        variables = self.data_model["groups"][0]["variables"]
+        streamed = dict(self.data_model, groups=[
+            {"code": "features", "label": "Features", "variables": (variable for variable in variables)}
+        ])
+        expected = dict(self.data_model, groups=[{"code": "features", "label": "Features", "variables": variables}])
+        self.assertEqual(json.loads(self.write(streamed, False, False)), expected)
+
+    def test_export_compact_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "output.json")
+            export_to_json(self.data_model, output_file, compact=True)
+            with open(output_file) as f:
+                content = f.read()
+        self.assertNotIn("\n", content)
+        self.assertEqual(json.loads(content), self.data_model)
+
+
 if __name__ == "__main__":
     unittest.main()
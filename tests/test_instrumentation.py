@@ -0,0 +1,87 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from converter import instrumentation
+from converter.instrumentation import recording, profiling, stage, CAPTURE_ENV_VAR
+from converter.fhir2mip import transform_data, export_to_json
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_data = {"entries": [{
+            "name": "SampleDataset",
+            "meta": {"versionId": "1.0"},
+            "featureSet": {
+                "features": [{"name": "Age", "description": "Age", "dataType": "NUMERIC", "statistics": {"min": 0, "max": 1}}],
+                "outcomes": [{"name": "Died", "description": "Died", "dataType": "BOOLEAN"}],
+            },
+        }]}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stages_are_recorded(self):
+        report_file = os.path.join(self.tmp_dir.name, "report.json")
+        with recording(report_file, captures=[]):
+            transformed_data = transform_data(self.input_data, os.path.join(self.tmp_dir.name, "rejected.txt"))
+            export_to_json(transformed_data, os.path.join(self.tmp_dir.name, "output.json"))
+            for _ in range(3):
+                with stage("custom"):
+                    pass
+
+        with open(report_file) as f:
+            report = json.load(f)
+        self.assertEqual(list(report["stages"]),
+                         ["transform_features", "transform_outcomes", "write_rejected", "export", "custom"])
+        self.assertEqual(report["stages"]["custom"]["calls"], 3)
+        self.assertIsNone(report["stages"]["export"]["traced_peak"])
+        self.assertGreaterEqual(report["total_wall_time"], sum(stats["wall_time"] for stats in report["stages"].values()))
+
+    def test_stage_is_a_no_op_outside_recording(self):
+        with stage("ignored"):
+            pass
+        with recording(captures=[]) as recorder:
+            pass
+        self.assertEqual(recorder.stages, {})
+
+    def test_profiling_only_records_when_asked(self):
+        with mock.patch.dict(os.environ, {CAPTURE_ENV_VAR: ""}):
+            with profiling():
+                self.assertIsNone(instrumentation._active_recorder)
+            report_file = os.path.join(self.tmp_dir.name, "report.json")
+            with profiling(report_file) as recorder:
+                with stage("asked"):
+                    pass
+        self.assertEqual(list(recorder.stages), ["asked"])
+        self.assertTrue(os.path.exists(report_file))
+
+    def test_captures_from_environment(self):
+        report_file = os.path.join(self.tmp_dir.name, "report.json")
+        with mock.patch.dict(os.environ, {CAPTURE_ENV_VAR: "cprofile, tracemalloc"}):
+            with recording(report_file):
+                with stage("outer"):
+                    with stage("inner"):
+                        data = [bytes(1024) for _ in range(1000)]
+                    del data
+
+        with open(report_file) as f:
+            report = json.load(f)
+        self.assertEqual(report["captures"], ["cprofile", "tracemalloc"])
+        self.assertGreater(report["stages"]["inner"]["traced_peak"], 1000 * 1024)
+        self.assertGreaterEqual(report["stages"]["outer"]["traced_peak"], report["stages"]["inner"]["traced_peak"])
+        self.assertTrue(report["top_allocations"])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, "report.prof")))
+
+    def test_unknown_capture(self):
+        with self.assertRaises(ValueError):
+            with recording(captures=["perf"]):
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
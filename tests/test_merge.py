@@ -0,0 +1,101 @@
+import os
+import json
+import tempfile
+import unittest
+
+from converter.merge import merge_data_models, iter_data_models
+from converter.synthetic import generate_feature_set
+
+
+def numeric(code, min_value, max_value):
+    return {"code": code, "label": code, "sql_type": "real", "isCategorical": False, "type": "real",
+            "enumerations": [], "minValue": min_value, "maxValue": max_value}
+
+
+def nominal(code, *values):
+    return {"code": code, "label": code, "sql_type": "text", "isCategorical": True, "type": "nominal",
+            "enumerations": [{"code": value, "label": value} for value in values]}
+
+
+def site(name, features, outcomes=()):
+    return {"code": name, "variables": [nominal(name, name)],
+            "groups": [{"code": "features", "label": "Features", "variables": list(features)},
+                       {"code": "outcomes", "label": "Outcomes", "variables": list(outcomes)}]}
+
+
+class TestMergeDataModels(unittest.TestCase):
+
+    def test_merges_by_normalised_code(self):
+        data_model, report = merge_data_models([
+            site("site_a", [numeric("age", 20, 60), nominal("Blood-Type", "A", "B")], [nominal("death", "True", "False")]),
+            site("site_b", [numeric("Age", 5, 50), nominal("blood_type", "B", "O")]),
+        ])
+        features, outcomes = data_model["groups"]
+        age, blood_type = features["variables"]
+        self.assertEqual(age["code"], "age")
+        self.assertEqual((age["minValue"], age["maxValue"]), (5, 60))
+        self.assertEqual(blood_type["code"], "blood_type")
+        self.assertEqual([e["code"] for e in blood_type["enumerations"]], ["A", "B", "O"])
+        self.assertEqual([v["code"] for v in outcomes["variables"]], ["death"])
+        self.assertEqual(data_model["variables"][0]["code"], "dataset")
+        self.assertEqual([e["code"] for e in data_model["variables"][0]["enumerations"]], ["site_a", "site_b"])
+        self.assertEqual(report["variables"], 3)
+        self.assertEqual(report["shared_by_all_sites"], 2)
+        self.assertEqual(report["type_conflicts"], [])
+
+    def test_reports_type_conflicts(self):
+        data_model, report = merge_data_models([
+            site("site_a", [numeric("bmi", 10, 40)]),
+            site("site_b", [nominal("bmi", "low", "high")]),
+        ])
+        bmi = data_model["groups"][0]["variables"][0]
+        self.assertEqual(bmi["type"], "real")
+        self.assertEqual(bmi["enumerations"], [])
+        [conflict] = report["type_conflicts"]
+        self.assertEqual((conflict["code"], conflict["site"], conflict["first_site"]), ("bmi", "site_b", "site_a"))
+        self.assertEqual(conflict["found"]["type"], "nominal")
+
+    def test_many_sites(self):
+        sites = [site(f"site_{i}", [numeric(f"var_{j}", -i, i) for j in range(200)]) for i in range(100)]
+        data_model, report = merge_data_models(sites)
+        variables = data_model["groups"][0]["variables"]
+        self.assertEqual(len(variables), 200)
+        self.assertEqual((variables[0]["minValue"], variables[0]["maxValue"]), (-99, 99))
+        self.assertEqual(report["shared_by_all_sites"], 200)
+
+    def test_raw_feature_sets(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "features.json")
+            with open(path, 'w') as f:
+                json.dump(generate_feature_set(num_features=20, num_outcomes=2, num_entries=2, seed=1), f)
+            data_models = list(iter_data_models([path]))
+        self.assertEqual(len(data_models), 2)
+        data_model, report = merge_data_models(data_models)
+        self.assertEqual(len(report["sites"]), 2)
+        self.assertEqual(sum(len(group["variables"]) for group in data_model["groups"]), report["variables"])
+
+    def test_sites_without_range(self):
+        # site_b gave no range (e.g. all its values were equal): the federated range cannot be trusted
+        without_range = {key: value for key, value in numeric("age", 0, 0).items() if key not in ("minValue", "maxValue")}
+        data_model, _ = merge_data_models([site("site_a", [numeric("age", 10, 20)]), site("site_b", [without_range])])
+        self.assertNotIn("minValue", data_model["groups"][0]["variables"][0])
+
+    def test_raw_feature_set_with_constant_values(self):
+        def bundle(name, minimum, maximum):
+            return {"entries": [{"name": name, "meta": {"versionId": "1.0"}, "featureSet": {"features": [
+                {"name": "Age", "description": "Age", "dataType": "NUMERIC",
+                 "statistics": {"min": minimum, "max": maximum, "numOfNotNull": 10}}]}}]}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for name, minimum, maximum in (("site_a", 10, 20), ("site_b", 50, 50)):
+                paths.append(os.path.join(tmp_dir, f"{name}.json"))
+                with open(paths[-1], 'w') as f:
+                    json.dump(bundle(name, minimum, maximum), f)
+            data_model, _ = merge_data_models(iter_data_models(paths))
+        age = data_model["groups"][0]["variables"][0]
+        self.assertEqual((age["minValue"], age["maxValue"]), (10, 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
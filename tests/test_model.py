@@ -0,0 +1,57 @@
+import json
+import pickle
+import unittest
+
+from converter.model import Variable, Enumerations, to_serialisable
+from converter.fhir2mip import transform_feature
+
+
+class TestVariableModel(unittest.TestCase):
+
+    def test_reads_and_compares_like_a_dict(self):
+        feature = {"name": "Gender", "description": "Patient's gender", "dataType": "NOMINAL",
+                   "statistics": {"valueset": ["Male", "Female"], "numOfNotNull": 100}}
+        variable = transform_feature(feature, [])
+        expected = {
+            "code": "gender",
+            "label": "Patient's gender",
+            "description": "Patient's gender",
+            "sql_type": "text",
+            "isCategorical": True,
+            "type": "nominal",
+            "methodology": "",
+            "units": "",
+            "enumerations": [{"code": "Male", "label": "Male"}, {"code": "Female", "label": "Female"}],
+        }
+        self.assertIsInstance(variable, Variable)
+        self.assertEqual(variable, expected)
+        self.assertEqual(variable["enumerations"][1]["code"], "Female")
+        self.assertNotIn("minValue", variable)
+        with self.assertRaises(KeyError):
+            variable["minValue"]
+        # Key order is kept when serialised
+        self.assertEqual(json.dumps(variable, default=to_serialisable), json.dumps(expected))
+
+    def test_numeric_range(self):
+        feature = {"name": "Age", "description": "Age", "dataType": "NUMERIC", "statistics": {"min": 0, "max": 100}}
+        variable = transform_feature(feature, [])
+        self.assertEqual(list(variable)[-2:], ["minValue", "maxValue"])
+        self.assertEqual((variable["minValue"], variable["maxValue"]), (0, 100))
+        self.assertEqual(Variable.from_dict(variable.to_dict()), variable)
+        self.assertEqual(pickle.loads(pickle.dumps(variable)), variable)
+
+    def test_enumeration_codes_are_interned_and_labels_shared(self):
+        first = Enumerations(["".join(["Y", "es"]), "No"])
+        second = Enumerations(["".join(["Ye", "s"]), "No"])
+        self.assertIs(first.codes[0], second.codes[0])
+        self.assertIsNone(first.labels)
+        labelled = Enumerations.from_dicts([{"code": "1", "label": "One"}])
+        self.assertEqual(labelled.to_dicts(), [{"code": "1", "label": "One"}])
+
+    def test_variables_have_no_instance_dict(self):
+        variable = transform_feature({"name": "Flag", "description": "Flag", "dataType": "BOOLEAN"}, [])
+        self.assertFalse(hasattr(variable, "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,256 @@
+import os
+import gzip
+import json
+import tempfile
+import unittest
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from converter.parque2csv import parquet_to_csv, columns_to_keep, profile_parquet, parquet_to_mip, convert_parquet
+from converter.validate import validate_data
+
+
+class TestParquetToCSV(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.parquet_file = os.path.join(self.tmp_dir.name, "cohort.parquet")
+        self.csv_file = os.path.join(self.tmp_dir.name, "cohort.csv")
+        self.df = pd.DataFrame({
+            "Patient": [f"p{index}" for index in range(10)],
+            "Age Years": [float(index) for index in range(10)],
+            "Is-Smoker": [index % 2 == 0 for index in range(10)],
+            "vital_signs_weight_value_stddev": [0.1] * 10,
+        })
+        # Several row groups, so that batches really are streamed
+        self.df.to_parquet(self.parquet_file, index=False, row_group_size=3)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_streamed_csv_matches_whole_table(self):
+        parquet_to_csv(self.parquet_file, self.csv_file, ["Patient", "vital_signs_weight_value_stddev"],
+                       dataset_name="study2", batch_size=4)
+        result = pd.read_csv(self.csv_file)
+        self.assertEqual(list(result.columns), ["age_years", "is_smoker", "dataset"])
+        self.assertEqual(len(result), 10)
+        self.assertEqual(result["age_years"].tolist(), self.df["Age Years"].tolist())
+        self.assertEqual(result["is_smoker"].tolist(), self.df["Is-Smoker"].tolist())
+        self.assertEqual(set(result["dataset"]), {"study2"})
+
+    def test_pipelined_output_matches_sequential(self):
+        sequential_file = os.path.join(self.tmp_dir.name, "sequential.csv")
+        sequential = parquet_to_csv(self.parquet_file, sequential_file, ["Patient"], batch_size=2)
+        pipelined = parquet_to_csv(self.parquet_file, self.csv_file, ["Patient"], batch_size=2, pipeline=True, queue_size=1)
+        with open(sequential_file) as f1, open(self.csv_file) as f2:
+            self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(pipelined, sequential)
+
+        parquet_output = os.path.join(self.tmp_dir.name, "output.parquet")
+        convert_parquet(self.parquet_file, parquet_output, ["Patient"], batch_size=2, pipeline=True)
+        self.assertEqual(pq.read_table(parquet_output).num_rows, 10)
+
+    def test_column_format_is_stable_across_batches(self):
+        # Nulls only in the last batch: the integers must not turn into floats there
+        # Written without pandas metadata, so that only the Arrow types can tell pandas the dtypes
+        pq.write_table(pa.table({"Count": [1, 2, 3, 4, None], "Flag": [True, False, True, False, None]}),
+                       self.parquet_file)
+        parquet_to_csv(self.parquet_file, self.csv_file, batch_size=3)
+        with open(self.csv_file) as f:
+            self.assertEqual(f.read().splitlines(),
+                             ["count,flag,dataset", '1,"True","study1"', '2,"False","study1"', '3,"True","study1"',
+                              '4,"False","study1"', ',,"study1"'])
+
+    def test_nested_columns(self):
+        pq.write_table(pa.table({"Age": [1.0, 2.0, None], "Codes": [[1, 2], None, [3]],
+                                 "Address": [{"city": "Athens"}, {"city": None}, None]}), self.parquet_file)
+        profile = profile_parquet(self.parquet_file)["columns"]
+        self.assertEqual(profile["Codes"], {"type": "list<element: int64>", "rows": 3, "null_count": 1,
+                                            "true_count": None, "distinct_count": None, "min": None, "max": None})
+
+        parquet_to_csv(self.parquet_file, self.csv_file)
+        self.assertEqual(len(pd.read_csv(self.csv_file)), 3)
+        data_model = parquet_to_mip(self.parquet_file, os.path.join(self.tmp_dir.name, "output.parquet"),
+                                    os.path.join(self.tmp_dir.name, "rejected.txt"))
+        types = {variable["code"]: variable["sql_type"] for variable in data_model["groups"][0]["variables"]}
+        self.assertEqual(types, {"age": "real", "codes": "text", "address": "text"})
+        output = pq.read_table(os.path.join(self.tmp_dir.name, "output.parquet"))
+        self.assertEqual(output.column("codes").to_pylist(), ["[1, 2]", None, "[3]"])
+
+    def test_empty_file_still_writes_header(self):
+        self.df.iloc[0:0].to_parquet(self.parquet_file, index=False)
+        parquet_to_csv(self.parquet_file, self.csv_file, ["Patient"])
+        with open(self.csv_file) as f:
+            self.assertEqual(f.read().splitlines(), ["age_years,is_smoker,vital_signs_weight_value_stddev,dataset"])
+
+    def test_drop_patterns(self):
+        parquet_to_csv(self.parquet_file, self.csv_file, ["Patient", "*_stddev", "re:Is-.*"])
+        self.assertEqual(list(pd.read_csv(self.csv_file).columns), ["age_years", "dataset"])
+
+    def test_columns_to_keep(self):
+        schema_names = ["Patient", "lab_results_bnp_value_first", "lab_results_bnp_value_max", "vital_signs_weight_value_first"]
+        kept, keep_dataset = columns_to_keep(schema_names, ["Patient", "lab_results_*_value_first"])
+        self.assertEqual(kept, ["lab_results_bnp_value_max", "vital_signs_weight_value_first"])
+        self.assertTrue(keep_dataset)
+        kept, keep_dataset = columns_to_keep(schema_names, ["dataset"])
+        self.assertEqual(kept, schema_names)
+        self.assertFalse(keep_dataset)
+
+    def test_bracketed_column_names(self):
+        schema_names = ["weight [kg]", "weight k", "height [cm]", "bmi"]
+        # An exact column name wins over its reading as a glob, which would match 'weight k' instead
+        kept, _ = columns_to_keep(schema_names, ["weight [kg]"])
+        self.assertEqual(kept, ["weight k", "height [cm]", "bmi"])
+        kept, _ = columns_to_keep(schema_names, ["height [[]cm]", "b?i"])
+        self.assertEqual(kept, ["weight [kg]", "weight k"])
+        with self.assertRaises(KeyError):
+            columns_to_keep(schema_names, ["weight [kg]", "bmi_z"])
+
+    def test_profile_written_alongside_csv(self):
+        profile_file = os.path.join(self.tmp_dir.name, "profile.json")
+        profile = parquet_to_csv(self.parquet_file, self.csv_file, ["Patient"], batch_size=4, profile_file=profile_file)
+        with open(profile_file) as f:
+            self.assertEqual(json.load(f), profile)
+        self.assertEqual(profile["rows"], 10)
+        self.assertEqual(set(profile["columns"]), {"Age Years", "Is-Smoker", "vital_signs_weight_value_stddev"})
+
+    def test_profile_statistics(self):
+        df = pd.DataFrame({
+            "flag": [True, False, None, True, True],
+            "code": ["True", "False", None, "NotTrue", "True"],
+            "value": [3.0, None, 1.5, 7.0, 3.0],
+        })
+        df.to_parquet(self.parquet_file, index=False, row_group_size=2)
+        profile = profile_parquet(self.parquet_file, batch_size=2, workers=2)
+        self.assertEqual(profile["rows"], 5)
+        self.assertEqual(profile["columns"]["flag"], {
+            "type": "bool", "rows": 5, "null_count": 1, "true_count": 3, "distinct_count": 2, "min": False, "max": True,
+        })
+        self.assertEqual(profile["columns"]["code"]["true_count"], 3)
+        self.assertEqual(profile["columns"]["code"]["distinct_count"], 3)
+        self.assertEqual(profile["columns"]["value"]["true_count"], None)
+        self.assertEqual(profile["columns"]["value"]["null_count"], 1)
+        self.assertEqual((profile["columns"]["value"]["min"], profile["columns"]["value"]["max"]), (1.5, 7.0))
+        self.assertEqual(profile["columns"]["value"]["distinct_count"], 3)
+
+    def test_profile_distinct_overflow(self):
+        profile = profile_parquet(self.parquet_file, columns=["Patient"], max_distinct=5)
+        self.assertIsNone(profile["columns"]["Patient"]["distinct_count"])
+
+    def test_single_pass_schema(self):
+        df = pd.DataFrame({
+            "Age Years": [30, 45, None, 60],
+            "Is-Smoker": [True, False, True, None],
+            "Gender": ["F", "M", "F", None],
+            "Never Filled": pd.Series([None] * 4, dtype="float64"),
+            "Died": [False, False, True, False],
+        })
+        df.to_parquet(self.parquet_file, index=False, row_group_size=2)
+        rejected_file = os.path.join(self.tmp_dir.name, "rejected.txt")
+
+        data_model = parquet_to_mip(self.parquet_file, self.csv_file, rejected_file, dataset_name="study2",
+                                    version="2.0", outcome_columns=["Died"], batch_size=3)
+
+        self.assertEqual((data_model["code"], data_model["version"]), ("study2", "2.0"))
+        features = {variable["code"]: variable for variable in data_model["groups"][0]["variables"]}
+        self.assertEqual(list(features), ["age_years", "is_smoker", "gender"])
+        self.assertEqual((features["age_years"]["minValue"], features["age_years"]["maxValue"]), (30, 60))
+        self.assertEqual(features["is_smoker"]["enumerations"], [{"code": "True", "label": "True"}, {"code": "False", "label": "False"}])
+        self.assertEqual([enumeration["code"] for enumeration in features["gender"]["enumerations"]], ["F", "M"])
+        self.assertEqual([variable["code"] for variable in data_model["groups"][1]["variables"]], ["died"])
+        with open(rejected_file) as f:
+            self.assertEqual(f.read().splitlines(), ["Never Filled"])
+
+        # The exported columns are exactly the schema variables: the null column is rejected and not exported
+        outcomes = [variable["code"] for variable in data_model["groups"][1]["variables"]]
+        self.assertEqual(list(pd.read_csv(self.csv_file).columns), list(features) + outcomes + ["dataset"])
+        self.assertTrue(validate_data(data_model, self.csv_file)["valid"])
+
+        # Without statistics the null column cannot be told apart before reading: it is still exported
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), self.parquet_file, row_group_size=2,
+                       write_statistics=False)
+        parquet_to_mip(self.parquet_file, self.csv_file, rejected_file, outcome_columns=["Died"], batch_size=3)
+        self.assertIn("never_filled", pd.read_csv(self.csv_file).columns)
+        with open(rejected_file) as f:
+            self.assertEqual(f.read().splitlines(), ["Never Filled"])
+
+    def test_dictionary_mode_matches_default(self):
+        df = pd.DataFrame({
+            "Age Years": [30.0, 45.0, None, 60.0, 21.0],
+            "Is-Smoker": [True, False, True, None, False],
+            "Gender": ["F", "M", "F", None, "True"],
+            "Died": [False, False, True, False, True],
+        })
+        df.to_parquet(self.parquet_file, index=False, row_group_size=2)
+        rejected_file = os.path.join(self.tmp_dir.name, "rejected.txt")
+        default_file = os.path.join(self.tmp_dir.name, "default.csv")
+
+        default = parquet_to_mip(self.parquet_file, default_file, rejected_file, outcome_columns=["Died"], batch_size=3)
+        dictionary = parquet_to_mip(self.parquet_file, self.csv_file, rejected_file, outcome_columns=["Died"],
+                                    batch_size=3, dictionary=True)
+        self.assertEqual(dictionary, default)
+        with open(default_file) as f1, open(self.csv_file) as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+        profile = convert_parquet(self.parquet_file, self.csv_file, batch_size=3, dictionary=True)
+        gender = profile["columns"]["Gender"]
+        self.assertEqual((gender["null_count"], gender["true_count"], gender["distinct_count"]), (1, 1, 3))
+        self.assertEqual((gender["min"], gender["max"]), ("F", "True"))
+
+    def test_typed_parquet_and_arrow_output(self):
+        df = pd.DataFrame({
+            "Age Years": [30, 45, None],
+            "Is-Smoker": [True, False, None],
+            "Gender": ["F", "M", None],
+            "Patient": ["p1", "p2", "p3"],
+        })
+        df.to_parquet(self.parquet_file, index=False, row_group_size=2)
+        expected_schema = pa.schema([("age_years", pa.float64()), ("is_smoker", pa.string()),
+                                     ("gender", pa.string()), ("dataset", pa.string())])
+
+        parquet_output = os.path.join(self.tmp_dir.name, "output.parquet")
+        convert_parquet(self.parquet_file, parquet_output, ["Patient"], batch_size=2)
+        table = pq.read_table(parquet_output)
+        self.assertEqual(table.schema, expected_schema)
+        self.assertEqual(table.column("is_smoker").to_pylist(), ["True", "False", None])
+        self.assertEqual(table.column("dataset").to_pylist(), ["study1"] * 3)
+
+        arrow_output = os.path.join(self.tmp_dir.name, "output.arrow")
+        convert_parquet(self.parquet_file, arrow_output, ["Patient"], batch_size=2)
+        with pa.ipc.open_file(arrow_output) as reader:
+            self.assertEqual(reader.read_all(), table)
+
+    def test_parquet_output_conforms_to_schema(self):
+        output_file = os.path.join(self.tmp_dir.name, "output.parquet")
+        data_model = parquet_to_mip(self.parquet_file, output_file, os.path.join(self.tmp_dir.name, "rejected.txt"),
+                                    ["Patient"], batch_size=4)
+        types = {variable["code"]: variable["sql_type"] for variable in data_model["groups"][0]["variables"]}
+        self.assertEqual(types, {"age_years": "real", "is_smoker": "text", "vital_signs_weight_value_stddev": "real"})
+        self.assertEqual(validate_data(data_model, output_file)["violations"], {})
+
+    def test_compressed_csv_output(self):
+        parquet_to_csv(self.parquet_file, self.csv_file, ["Patient"], batch_size=4)
+        compressed_file = self.csv_file + ".gz"
+        data_model = parquet_to_mip(self.parquet_file, compressed_file, os.path.join(self.tmp_dir.name, "rejected.txt"),
+                                    ["Patient"], batch_size=4)
+        with open(self.csv_file, 'rb') as f1, gzip.open(compressed_file, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(validate_data(data_model, compressed_file)["violations"], {})
+
+        with self.assertRaises(ValueError):
+            convert_parquet(self.parquet_file, os.path.join(self.tmp_dir.name, "output.parquet"), compression="zstd")
+
+    def test_invalid_output_format(self):
+        with self.assertRaises(ValueError):
+            convert_parquet(self.parquet_file, self.csv_file, output_format="xlsx")
+
+    def test_unknown_column_to_remove(self):
+        with self.assertRaises(KeyError):
+            parquet_to_csv(self.parquet_file, self.csv_file, ["NoSuchColumn"])
+        self.assertFalse(os.path.exists(self.csv_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import unittest
+
+from converter.pipeline import background, BackgroundWriter
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_background_yields_every_item_in_order(self):
+        self.assertEqual(list(background(range(100), queue_size=3)), list(range(100)))
+
+    def test_background_runs_ahead_by_at_most_queue_size(self):
+        produced = []
+        consumed = threading.Event()
+
+        def items():
+            for item in range(10):
+                produced.append(item)
+                yield item
+
+        iterator = background(items(), queue_size=2)
+        self.assertEqual(next(iterator), 0)
+        consumed.wait(0.3)
+        # One item handed out, two queued and at most one more blocked on the full queue
+        self.assertLessEqual(len(produced), 4)
+        iterator.close()
+
+    def test_background_reraises_producer_errors(self):
+        def items():
+            yield 1
+            raise KeyError("broken batch")
+
+        iterator = background(items())
+        self.assertEqual(next(iterator), 1)
+        with self.assertRaises(KeyError):
+            next(iterator)
+
+    def test_writer_writes_in_order(self):
+        written = []
+        with BackgroundWriter(written.append, queue_size=1) as writer:
+            for item in range(50):
+                writer.submit(item)
+        self.assertEqual(written, list(range(50)))
+
+    def test_writer_failure_is_raised(self):
+        def write(item):
+            if item == 3:
+                raise OSError("disk full")
+
+        writer = BackgroundWriter(write, queue_size=1)
+        with self.assertRaises(OSError):
+            for item in range(100):
+                writer.submit(item)
+            writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
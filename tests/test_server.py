@@ -0,0 +1,190 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from converter.fhir2mip import transform_entry
+from converter.model import to_serialisable
+from converter.server import ConversionServer
+from converter.synthetic import generate_feature_set
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MINIMAL_FHIR = os.path.join(ROOT, "data", "minimal_fhir.json")
+
+
+class TestConversionServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # A single worker, so that its warm inputs see every request
+        self.server = ConversionServer(workers=1, root=self.tmp_dir.name)
+        self.host, self.port = await self.server.start(port=0)
+        self.clients = ThreadPoolExecutor(max_workers=8)
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.clients.shutdown()
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    async def request(self, method, target, body=None, headers=None):
+        if headers is None:
+            headers = {"Content-Type": "application/json"} if method == "POST" else {}
+
+        def send():
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                connection.request(method, target, body, headers)
+                response = connection.getresponse()
+                return response.status, json.loads(response.read())
+            finally:
+                connection.close()
+        return await asyncio.get_running_loop().run_in_executor(self.clients, send)
+
+    async def test_schema_from_body_is_cached(self):
+        with open(MINIMAL_FHIR, 'rb') as f:
+            body = f.read()
+        data_model, rejected = transform_entry(json.loads(body)["entries"][0])
+        expected = json.loads(json.dumps({"data_model": data_model, "rejected": rejected}, default=to_serialisable))
+
+        for _ in range(3):
+            status, response = await self.request("POST", "/schema", body)
+            self.assertEqual(status, 200)
+            self.assertEqual(response, expected)
+
+        status, metrics = await self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertEqual(metrics["routes"]["/schema"]["requests"], 3)
+        self.assertEqual((metrics["response_cache"]["hits"], metrics["response_cache"]["misses"]), (2, 1))
+        self.assertIsNotNone(metrics["routes"]["/schema"]["latency_ms"]["p95"])
+
+    async def test_schema_from_files(self):
+        input_file = self.path("features.json")
+        with open(input_file, 'w') as f:
+            json.dump(generate_feature_set(num_features=20, num_outcomes=2, num_entries=3, seed=1), f)
+
+        status, response = await self.request(
+            "POST", f"/schema?input_file={input_file}&output_file={self.path('out.json')}"
+                    f"&rejected_file={self.path('rejected.txt')}&all_entries=1")
+        self.assertEqual(status, 200, response)
+        self.assertEqual(response["data_models"], 3)
+        with open(self.path("out.json")) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        with open(self.path("rejected.txt")) as f:
+            self.assertEqual(f.read().splitlines(), response["rejected"])
+
+        # The entries were transformed once; the same unchanged input again reuses them
+        status, response = await self.request("POST", f"/schema?input_file={input_file}&all_entries=1")
+        self.assertEqual(len(response["data_models"]), 3)
+        data_models = response["data_models"]
+        _, metrics = await self.request("GET", "/metrics")
+        self.assertEqual(metrics["transform_cache"], {"hits": 1, "misses": 1})
+
+        # A modified input is transformed again
+        with open(input_file, 'w') as f:
+            json.dump(generate_feature_set(num_features=21, num_outcomes=2, num_entries=3, seed=1), f)
+        status, response = await self.request("POST", f"/schema?input_file={input_file}&all_entries=1")
+        self.assertNotEqual(response["data_models"], data_models)
+        _, metrics = await self.request("GET", "/metrics")
+        self.assertEqual(metrics["transform_cache"], {"hits": 1, "misses": 2})
+
+    async def test_features_concurrently(self):
+        features = [{"name": f"Feature {index}", "description": "", "dataType": "NUMERIC",
+                     "statistics": {"numOfNotNull": index, "min": 0, "max": index}} for index in range(8)]
+        results = await asyncio.gather(*(self.request("POST", "/feature", json.dumps(feature))
+                                         for feature in features))
+        for index, (status, response) in enumerate(results):
+            self.assertEqual(status, 200)
+            self.assertEqual(response["rejected"], index == 0)
+            if index:
+                self.assertEqual(response["variable"]["code"], f"feature_{index}")
+
+        status, response = await self.request("POST", "/feature", json.dumps(features[:2]))
+        self.assertEqual([result["rejected"] for result in response], [True, False])
+
+    async def test_data(self):
+        parquet_file = self.path("cohort.parquet")
+        pd.DataFrame({"Age": [30.0, 40.0, None], "Gender": ["F", "M", "F"]}).to_parquet(parquet_file, index=False)
+        options = {"parquet_file": parquet_file, "output_file": self.path("cohort.csv"),
+                   "schema_file": self.path("schema.json"), "dataset_name": "site_a"}
+        status, response = await self.request("POST", "/data", json.dumps(options))
+        self.assertEqual(status, 200, response)
+        with open(self.path("schema.json")) as f:
+            self.assertEqual(json.load(f)["code"], "site_a")
+        self.assertEqual(list(pd.read_csv(self.path("cohort.csv")).columns), ["age", "gender", "dataset"])
+
+    async def test_errors(self):
+        self.assertEqual((await self.request("POST", "/schema", b"{not json"))[0], 400)
+        self.assertEqual((await self.request("POST", "/schema", b'{"entries": []}'))[0], 400)
+        self.assertEqual((await self.request("POST", f"/schema?input_file={self.path('missing.json')}"))[0], 404)
+        self.assertEqual((await self.request("GET", "/schema"))[0], 405)
+        self.assertEqual((await self.request("GET", "/unknown"))[0], 404)
+        _, metrics = await self.request("GET", "/metrics")
+        self.assertEqual(metrics["errors"], 5)
+
+    async def test_rejects_browser_requests(self):
+        with open(MINIMAL_FHIR, 'rb') as f:
+            body = f.read()
+        json_type = {"Content-Type": "application/json"}
+        for headers, status in [({**json_type, "Origin": "https://example.org"}, 403),
+                                ({**json_type, "Origin": "null"}, 403),
+                                ({**json_type, "Host": "attacker.example.org"}, 403),
+                                ({**json_type, "Host": "attacker.example.org:8765"}, 403),
+                                ({"Content-Type": "text/plain"}, 415),
+                                ({"Content-Type": "application/x-www-form-urlencoded"}, 415),
+                                ({}, 415)]:
+            self.assertEqual((await self.request("POST", "/schema", body, headers))[0], status, headers)
+        self.assertEqual((await self.request("GET", "/metrics", headers={"Origin": "https://example.org"}))[0], 403)
+        self.assertEqual((await self.request("POST", "/schema", body, {"Host": "localhost",
+                                                                     "Content-Type": "application/json; charset=utf-8"}))[0], 200)
+
+    async def test_paths_confined_to_root(self):
+        outside = tempfile.TemporaryDirectory()
+        self.addCleanup(outside.cleanup)
+        input_file = self.path("features.json")
+        with open(input_file, 'w') as f:
+            json.dump(generate_feature_set(num_features=5, num_outcomes=1, seed=1), f)
+        os.symlink(outside.name, self.path("link"))
+
+        for target in [f"/schema?input_file={MINIMAL_FHIR}",
+                       f"/schema?input_file={input_file}&output_file={os.path.join(outside.name, 'out.json')}",
+                       f"/schema?input_file={input_file}&rejected_file={self.path('../rejected.txt')}",
+                       f"/schema?input_file={input_file}&output_file={self.path('link/out.json')}"]:
+            self.assertEqual((await self.request("POST", target))[0], 403, target)
+        options = {"parquet_file": self.path("cohort.parquet"), "output_file": os.path.join(outside.name, "cohort.csv")}
+        self.assertEqual((await self.request("POST", "/data", json.dumps(options)))[0], 403)
+        self.assertEqual(os.listdir(outside.name), [])
+
+        # Relative paths are resolved against the root
+        status, response = await self.request("POST", "/schema?input_file=features.json&output_file=out.json")
+        self.assertEqual(status, 200, response)
+        self.assertEqual(response["output_file"], os.path.join(os.path.realpath(self.tmp_dir.name), "out.json"))
+
+
+class TestUnixSocketServer(unittest.IsolatedAsyncioTestCase):
+
+    async def test_health_over_unix_socket(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = os.path.join(tmp_dir, "converter.sock")
+            server = ConversionServer(workers=1, root=tmp_dir)
+            await server.start(unix_path=socket_path)
+            try:
+                reader, writer = await asyncio.open_unix_connection(socket_path)
+                writer.write(b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                response = await reader.read()
+                writer.close()
+            finally:
+                await server.close()
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+        self.assertTrue(response.endswith(b'{"status": "ok"}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
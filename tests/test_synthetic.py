@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import pyarrow.parquet as pq
+
+from converter.synthetic import generate_feature_set, write_cohort
+from converter.fhir2mip import transform_all_entries
+from benchmarks.run_benchmarks import compare_to_baseline
+
+
+class TestSyntheticData(unittest.TestCase):
+
+    def test_feature_set_shape(self):
+        feature_set = generate_feature_set(num_features=200, num_outcomes=5, valueset_size=7, num_entries=2,
+                                           type_mix={"NOMINAL": 1})
+        self.assertEqual(len(feature_set["entries"]), 2)
+        features = feature_set["entries"][0]["featureSet"]["features"]
+        self.assertEqual(len(features), 200)
+        self.assertEqual(len(feature_set["entries"][0]["featureSet"]["outcomes"]), 5)
+        self.assertTrue(all(len(feature["statistics"]["valueset"]) == 7 for feature in features))
+        self.assertEqual(generate_feature_set(num_features=50, seed=3), generate_feature_set(num_features=50, seed=3))
+
+    def test_feature_set_transforms(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_models = transform_all_entries(generate_feature_set(num_features=300, rejected_ratio=0.1),
+                                                os.path.join(tmp_dir, "rejected.txt"), workers=1)
+            with open(os.path.join(tmp_dir, "rejected.txt")) as f:
+                rejected = f.read().splitlines()
+        self.assertEqual(len(data_models[0]["groups"][0]["variables"]) + len(data_models[0]["groups"][1]["variables"]),
+                         310 - len(rejected))
+        self.assertTrue(rejected)
+
+    def test_cohort_row_groups(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cohort.parquet")
+            write_cohort(path, num_rows=250, num_numeric=2, num_nominal=3, num_boolean=1, num_dropped=1, row_group_size=100)
+            parquet = pq.ParquetFile(path)
+            self.assertEqual(parquet.metadata.num_rows, 250)
+            self.assertEqual(parquet.metadata.num_row_groups, 3)
+            self.assertEqual(len(parquet.schema_arrow), 8)
+
+
+class TestBaselineComparison(unittest.TestCase):
+
+    def test_regressions_are_flagged(self):
+        baseline = {"results": {"transform_data": {"wall_time": 1.0, "peak_rss": 100}, "parquet_to_csv": {"wall_time": 1.0, "peak_rss": None}}}
+        results = {
+            "transform_data": {"wall_time": 1.1, "peak_rss": 150},
+            "parquet_to_csv": {"wall_time": 2.0, "peak_rss": None},
+            "new_stage": {"wall_time": 5.0, "peak_rss": 1},
+        }
+        regressions = compare_to_baseline(results, baseline, threshold=0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("transform_data: peak_rss"))
+        self.assertTrue(regressions[1].startswith("parquet_to_csv: wall_time"))
+
+
+if __name__ == "__main__":
+    unittest.main()
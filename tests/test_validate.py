@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from converter.validate import validate_data, index_variables
+from converter.parque2csv import parquet_to_mip
+
+
+class TestValidateData(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_file = os.path.join(self.tmp_dir.name, "data.csv")
+        self.data_model = {
+            "code": "study1",
+            "variables": [{"code": "dataset", "isCategorical": True, "type": "nominal",
+                           "enumerations": [{"code": "study1", "label": "study1"}]}],
+            "groups": [{"code": "features", "variables": [
+                {"code": "age", "isCategorical": False, "type": "real", "minValue": 0, "maxValue": 100, "enumerations": []},
+                {"code": "is_smoker", "isCategorical": True, "type": "nominal",
+                 "enumerations": [{"code": "True", "label": "True"}, {"code": "False", "label": "False"}]},
+            ], "groups": [{"code": "nested", "variables": [
+                {"code": "gender", "isCategorical": True, "type": "nominal",
+                 "enumerations": [{"code": "F", "label": "F"}, {"code": "M", "label": "M"}]},
+            ]}]}],
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_csv(self, content):
+        with open(self.csv_file, 'w') as f:
+            f.write(content)
+
+    def test_index_includes_nested_groups(self):
+        self.assertEqual(sorted(index_variables(self.data_model)), ["age", "dataset", "gender", "is_smoker"])
+
+    def test_conforming_data(self):
+        self.write_csv("age,is_smoker,gender,dataset\n30,True,F,study1\n,False,,study1\n100,False,M,study1\n")
+        summary = validate_data(self.data_model, self.csv_file, block_size=64)
+        self.assertTrue(summary["valid"], summary)
+        self.assertEqual(summary["rows"], 3)
+
+    def test_violations(self):
+        self.write_csv("Age,is_smoker,gender,extra\n-1,True,F,x\n101,yes,X,y\nabc,False,M,z\n50,maybe,X,w\n")
+        summary = validate_data(self.data_model, self.csv_file, block_size=64)
+        self.assertFalse(summary["valid"])
+        self.assertEqual(summary["unknown_columns"], ["extra"])
+        self.assertEqual(summary["missing_columns"], ["dataset"])
+        self.assertEqual(summary["unnormalised_columns"], {"Age": "age"})
+        self.assertEqual(summary["violations"]["age"], {"invalid_numeric": 1, "out_of_range": 2, "examples": ["-1", "101", "abc"]})
+        self.assertEqual(summary["violations"]["is_smoker"]["not_in_enumerations"], 2)
+        self.assertEqual(summary["violations"]["gender"], {"not_in_enumerations": 2, "examples": ["X"]})
+        self.assertEqual(summary["violation_count"], 7)
+
+    def test_parquet_pipeline_conforms_to_its_schema(self):
+        parquet_file = os.path.join(self.tmp_dir.name, "cohort.parquet")
+        pd.DataFrame({
+            "Age Years": [30.5, 45.0, None, 60.0],
+            "Is-Smoker": [True, False, True, None],
+            "Gender": ["F", "M", "F", None],
+        }).to_parquet(parquet_file, index=False)
+        data_model = parquet_to_mip(parquet_file, self.csv_file, os.path.join(self.tmp_dir.name, "rejected.txt"))
+
+        summary = validate_data(data_model, self.csv_file)
+        self.assertEqual(summary["violations"], {})
+        self.assertEqual(summary["unnormalised_columns"], {})
+        self.assertEqual(summary["unknown_columns"], [])
+        self.assertEqual(summary["missing_columns"], [])
+        self.assertTrue(summary["valid"], summary)
+
+        # The 'dataset' column is checked against the dataset variable, coded after the dataset name
+        with open(self.csv_file, 'a') as f:
+            f.write("30.5,True,F,study2\n")
+        summary = validate_data(data_model, self.csv_file)
+        self.assertEqual(summary["violations"], {"study1": {"not_in_enumerations": 1, "examples": ["study2"]}})
+
+
+if __name__ == "__main__":
+    unittest.main()